@@ -1,8 +1,26 @@
 import argparse
+import codecs
+import collections
+import copy
+import cProfile
+import enum
+import fnmatch
 import glob
+import hashlib
+import heapq
+import inspect
 import io
+import json
+import linecache
+import re
+import subprocess
 import sys
+import tarfile
+import time
+import tracemalloc
 import os
+import zipfile
+import zlib
 
 SPACE = " "
 TAB = "\t"
@@ -13,34 +31,281 @@ DblQuote = '"'
 class AppException(Exception):
     __slots__ = []
 
+class LogLevel(enum.IntEnum):
+    QUIET = 0
+    NORMAL = 1
+    VERBOSE = 2
+    DEBUG = 3
+
+class ReportWriter(object):
+    '''Streams structured records to a file as newline-delimited JSON (NDJSON); one object per line'''
+
+    __slots__ = ["__file"]
+
+    def __init__(self, file_path):
+        self.__file = open(file_path, "w", encoding="utf-8")
+
+    def write(self, record_type, **fields):
+        '''Writes a record; an object with "type" set to record_type plus fields'''
+        self.write_record({"type": record_type, **fields})
+
+    def write_record(self, record):
+        self.__file.write(json.dumps(record, ensure_ascii=False))
+        self.__file.write("\n")
+
+    def close(self):
+        self.__file.close()
+
+class ReportMerger(object):
+    '''Combines the reports of separate runs, such as the shards of a sharded run, into one report'''
+
+    __slots__ = ["__logger"]
+
+    def __init__(self, logger):
+        self.__logger = logger
+
+    def merge(self, report_paths, output_path):
+        '''
+        Writes the records of each report to the output report followed by a combined summary
+
+        ### Returns
+        dict: Combined summary record
+        '''
+        summary = {"type": "summary", "processed": 0, "changed": 0, "failed": 0, "skipped": 0, "classified": {}, "shards": []}
+        shard_count = None
+        output = ReportWriter(output_path)
+        try:
+            for report_path in report_paths:
+                report_summary = None
+                with open(report_path, encoding="utf-8") as f:
+                    for line_number, line in enumerate(f):
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            raise AppException(f"{report_path}:{line_number + 1}: invalid report record")
+                        if record.get("type") == "summary":
+                            report_summary = record
+                        else:
+                            output.write_record(record)
+                if report_summary is None:
+                    self.__logger.log(f"{report_path}: Warning: no summary; the run may be incomplete")
+                    continue
+                for key in ["processed", "changed", "failed", "skipped"]:
+                    summary[key] += report_summary.get(key, 0)
+                for classification, count in report_summary.get("classified", {}).items():
+                    summary["classified"][classification] = summary["classified"].get(classification, 0) + count
+                if "shard" in report_summary:
+                    shard = FileShard.parse(report_summary["shard"])
+                    shard_count = shard_count or shard.count
+                    if shard.count != shard_count:
+                        raise AppException(f"{report_path}: shard {shard} is from a run with a different shard count than {shard_count}")
+                    summary["shards"].append(str(shard))
+            if shard_count:
+                merged_indexes = set(FileShard.parse(shard).index for shard in summary["shards"])
+                missing_indexes = [str(index) for index in range(1, shard_count + 1) if index not in merged_indexes]
+                if missing_indexes:
+                    self.__logger.log(f"Warning: missing shard(s) {', '.join(missing_indexes)} of {shard_count}")
+            output.write_record(summary)
+        finally:
+            output.close()
+        return summary
+
 class Logger(object):
-    __slots__ = ["__is_verbose_enabled", "__is_debug_enabled"]
+    '''
+    Buffered logger with levels. Messages are formatted only when enabled for the logger's level and
+    are written in batches; when the buffer is full or flush_interval seconds after the last write, so
+    that little output is lost if a run is killed. Optionally streams structured records to a ReportWriter.
+    '''
 
-    def __init__(self):
-        self.__is_verbose_enabled = False
+    __slots__ = ["__level", "__buffer", "__buffer_limit", "__flush_interval", "__flush_time", "__report"]
+
+    def __init__(self, buffer_limit=256, flush_interval=0.5):
+        self.__level = LogLevel.NORMAL
+        self.__buffer = []
+        self.__buffer_limit = buffer_limit
+        self.__flush_interval = flush_interval
+        self.__flush_time = time.monotonic()
+        self.__report = None
+
+    @property
+    def level(self):
+        return self.__level
+    @level.setter
+    def level(self, to):
+        self.__level = LogLevel(to)
 
     @property
     def is_verbose_enabled(self):
-        return self.__text
+        return self.__level >= LogLevel.VERBOSE
     @is_verbose_enabled.setter
     def is_verbose_enabled(self, to):
-        self.__is_verbose_enabled = bool(to)
+        if to:
+            self.__level = max(self.__level, LogLevel.VERBOSE)
+        elif self.__level >= LogLevel.VERBOSE:
+            self.__level = LogLevel.NORMAL
+
+    @property
+    def report(self):
+        '''Sink for structured records (ReportWriter) or None'''
+        return self.__report
+    @report.setter
+    def report(self, to):
+        self.__report = to
+
+    @property
+    def is_change_logging_enabled(self):
+        '''Whether individual changes are logged or reported; collecting them can be skipped otherwise'''
+        return self.is_verbose_enabled or self.__report is not None
 
     def log(self, message):
-        print(message)
+        if self.__level >= LogLevel.NORMAL:
+            self.__buffer.append(message)
+            if len(self.__buffer) >= self.__buffer_limit or \
+                    time.monotonic() - self.__flush_time >= self.__flush_interval:
+                self.flush()
 
-    def log_verbose(self, message):
-        if self.__is_verbose_enabled:
-            self.log(message)
+    def log_verbose(self, message, *args):
+        '''Logs message (formatted with args via str.format) if verbose logging is enabled'''
+        if self.__level >= LogLevel.VERBOSE:
+            self.log(message.format(*args) if args else message)
+
+    def log_debug(self, message, *args):
+        '''Logs message (formatted with args via str.format) if debug logging is enabled'''
+        if self.__level >= LogLevel.DEBUG:
+            self.log(message.format(*args) if args else message)
+
+    def log_changes(self, file_path, changes):
+        '''
+        Logs the changes to a file as a batch
+
+        ### Parameters
+        file_path (string): Path of the changed file
+        changes (list): (line index, message) tuples
+        '''
+        if self.is_verbose_enabled:
+            for line_index, message in changes:
+                self.log(f"{file_path}:{line_index + 1}: {message}")
+        if self.__report is not None:
+            for line_index, message in changes:
+                self.__report.write("change", path=file_path, line=line_index + 1, message=message)
+
+    def report_record(self, record_type, **fields):
+        '''Writes a structured record to the report; if any'''
+        if self.__report is not None:
+            self.__report.write(record_type, **fields)
+
+    def flush(self):
+        '''Writes buffered messages'''
+        if self.__buffer:
+            self.__buffer.append("")
+            sys.stdout.write("\n".join(self.__buffer))
+            sys.stdout.flush()
+            self.__buffer.clear()
+        self.__flush_time = time.monotonic()
+
+class RunProfiler(object):
+    '''
+    Captures a CPU profile (cProfile) and/or memory allocations (tracemalloc) of a run so that a slow
+    or memory-heavy run can be diagnosed from a bug report.
+
+    ### Parameters
+    logger (Logger): Logs results
+    profile_path (string|None): Path of the pstats file to write the CPU profile to; None for no CPU profile
+    traced_classes (type[]): Classes whose allocation sites are reported; empty for no memory tracing
+    '''
+
+    __slots__ = ["__logger", "__profile_path", "__profiler", "__traced_line_ranges", "__snapshot", "__snapshot_size"]
+
+    # number of allocation sites reported
+    TOP_SITE_COUNT = 10
+
+    def __init__(self, logger, profile_path=None, traced_classes=()):
+        self.__logger = logger
+        self.__profile_path = profile_path
+        self.__profiler = None
+        self.__traced_line_ranges = []
+        for cls in traced_classes:
+            source_lines, first_line_number = inspect.getsourcelines(cls)
+            self.__traced_line_ranges.append((cls.__name__, first_line_number, first_line_number + len(source_lines)))
+        self.__snapshot = None
+        self.__snapshot_size = 0
+
+    def start(self):
+        if self.__traced_line_ranges:
+            tracemalloc.start()
+        if self.__profile_path:
+            self.__profiler = cProfile.Profile()
+            self.__profiler.enable()
+
+    def sample(self):
+        '''
+        Takes a memory snapshot if traced memory is larger than at the previous snapshot; called when
+        memory use is likely high such as after conforming a file. Allocations that are freed before
+        the end of a run are reported from the largest snapshot.
+        '''
+        if not tracemalloc.is_tracing():
+            return
+        size = tracemalloc.get_traced_memory()[0]
+        if size > self.__snapshot_size:
+            self.__snapshot = tracemalloc.take_snapshot()
+            self.__snapshot_size = size
+
+    def stop(self):
+        '''Stops capturing and writes the CPU profile and logs the memory report'''
+        if self.__profiler:
+            self.__profiler.disable()
+            self.__profiler.dump_stats(self.__profile_path)
+            self.__profiler = None
+            self.__logger.log(f"Profile: written to {self.__profile_path}; view with: python -m pstats {self.__profile_path}")
+        if tracemalloc.is_tracing():
+            self.sample()
+            peak_size = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.__log_memory(peak_size)
+
+    def __get_class_name(self, frame):
+        if frame.filename == __file__:
+            for class_name, start_line_number, end_line_number in self.__traced_line_ranges:
+                if start_line_number <= frame.lineno < end_line_number:
+                    return class_name
+        return None
+
+    def __log_memory(self, peak_size):
+        sites = []
+        if self.__snapshot:
+            for stat in self.__snapshot.statistics("lineno"):
+                frame = stat.traceback[0]
+                class_name = self.__get_class_name(frame)
+                if class_name:
+                    sites.append({"class": class_name, "line": frame.lineno, "size": stat.size, "count": stat.count,
+                                  "code": linecache.getline(frame.filename, frame.lineno).strip()})
+                    if len(sites) == self.TOP_SITE_COUNT:
+                        break
+        self.__logger.log(f"Memory: peak: {peak_size / 1024:.1f} KiB; at largest sample: {self.__snapshot_size / 1024:.1f} KiB")
+        for site in sites:
+            self.__logger.log(f"  {site['class']}:{site['line']}: {site['size'] / 1024:.1f} KiB in {site['count']} block(s): {site['code']}")
+        self.__logger.report_record("memory", peak=peak_size, sampled=self.__snapshot_size, sites=sites)
 
 class FileConformer(object):
     '''Provides for editing the content of a file'''
     
-    __slots__ = "__file_text", "__text", "__file_path", "__logger", "__encoding"
+    __slots__ = "__is_modified", "__text", "__file_path", "__logger", "__encoding", "__content_digest", "__time_budget", "__deadline", \
+        "__changes"
+
+    # maximum length of text split into lines at once
+    CHUNK_SIZE = 1 << 16
+    # number of lines between checks of the time budget
+    BUDGET_CHECK_LINES = 64
 
     def __init__(self, logger):
         self.__logger = logger
         self.__text = ""
+        self.__is_modified = False
+        self.__time_budget = None
+        self.__deadline = None
+        self.__file_path = None
+        self.__content_digest = None
+        self.__changes = None
 
     @property
     def text(self):
@@ -48,33 +313,83 @@ class FileConformer(object):
         return self.__text
     @text.setter
     def text(self, to):
-        self.__text = str(to)
+        to = str(to)
+        if to != self.__text:
+            self.__is_modified = True
+        self.__text = to
 
     @property
     def is_modified(self):
-        return self.__text != self.__file_text
+        '''Whether the text has changed since loaded; tracked as changes are made'''
+        return self.__is_modified
+
+    @property
+    def time_budget(self):
+        '''
+        Seconds that conform_lines can take before it is aborted or None for no limit.
+        Checked every BUDGET_CHECK_LINES lines and after each chunk of lines; a single line is not
+        interrupted (see ContentGuard.BUDGET_MAX_LINE_LENGTH).
+        '''
+        return self.__time_budget
+    @time_budget.setter
+    def time_budget(self, to):
+        if to is not None and to <= 0:
+            raise AppException("Time budget must be more than 0")
+        self.__time_budget = to
+
+    @property
+    def content_digest(self):
+        '''Digest (SHA-256 hex) of the loaded file content; None unless loaded with digest_content'''
+        return self.__content_digest
+
+    @property
+    def changes(self):
+        '''(line index, message) tuples of the last conform_lines or None if change logging is disabled'''
+        return self.__changes
+
+    def load_from_file(self, file_path, encoding, digest_content=False):
+        '''Loads and caches the content of a file; with universal newlines like reading in text mode'''
+        with open(file_path, "rb") as f:
+            self.load_from_bytes(f.read(), encoding, file_path, digest_content)
 
-    def load_from_file(self, file_path, encoding):
-        '''Loads and caches the content of a file'''
+    def load_from_bytes(self, data, encoding, file_path, digest_content=False):
+        '''
+        Loads and caches content that is already in memory such as an archive member
+
+        ### Parameters
+        data (bytes): Encoded content
+        encoding (string): Text encoding of data
+        file_path (string): Identifies the content in log messages; not opened
+        digest_content (bool): Whether to compute content_digest
+        '''
         self.__file_path = file_path
         self.__encoding = encoding
-        with open(file_path, "r", encoding=encoding) as f:
-            self.__file_text = self.__text = f.read()
+        self.__content_digest = hashlib.sha256(data).hexdigest() if digest_content else None
+        self.__text = data.decode(encoding).replace("\r\n", "\n").replace("\r", "\n")
+        self.__is_modified = False
+        self.__changes = None
+
+    def get_bytes(self):
+        '''Returns the cached content encoded with the encoding it was loaded with; with \\n new lines'''
+        return self.__text.encode(self.__encoding)
 
     def save_to_file(self):
         '''Saves the cached file content to the file from which it was loaded using the same encoding'''
         if not self.__file_path:
             raise RuntimeError("Must load file first")
-        self.__logger.log_verbose(f"Saving {self.__file_path} encoding:{self.__encoding}")
+        self.__logger.log_verbose("Saving {} encoding:{}", self.__file_path, self.__encoding)
         with open(self.__file_path, "w", encoding=self.__encoding) as f:
             f.write(self.__text)
 
     class FileContext(object):
-        __slots__ = ["__line_number", "__log_change", "__change_count"]
+        '''Counts the changes to a file and collects them for logging if changes is a list'''
+
+        __slots__ = ["__line_number", "__changes", "__change_count"]
 
-        def __init__(self, log_change):
+        def __init__(self, changes):
+            self.__line_number = 0
             self.__change_count = 0
-            self.__log_change = log_change
+            self.__changes = changes
 
         def set_line_number(self, to):
             self.__line_number = to
@@ -84,54 +399,791 @@ class FileConformer(object):
 
         def log(self, message):
             self.__change_count +=1
-            self.__log_change(self.__line_number, message)
+            if self.__changes is not None:
+                self.__changes.append((self.__line_number, message))
+
+    @staticmethod
+    def parse_line_range(spec):
+        '''Returns (start, end) line numbers (1-based, inclusive) for text formatted as START-END or LINE'''
+        match = re.fullmatch(r"\s*(\d+)\s*(?:-\s*(\d+)\s*)?", spec)
+        if not match:
+            raise AppException(f"Line range must be formatted as START-END or LINE such as 10-20; not '{spec}'")
+        start = int(match.group(1))
+        end = int(match.group(2) or start)
+        if start < 1 or end < start:
+            raise AppException(f"Line range must have 1 <= START <= END; not '{spec}'")
+        return start, end
 
-    def __log_change(self, line_number, message):
-        self.__logger.log_verbose(f"{self.__file_path}:{line_number + 1}: {message}")
+    def __conform_span(self, text, start, end, first_line_index, operations, context, pieces, copy_start):
+        '''
+        Conforms the lines of text[start:end] which is a whole number of lines.
+        Lines are tracked as offsets into text and only a line that an operation changes is added to
+        pieces along with the unchanged text before it (from copy_start) as a single slice.
+        Returns the offset of the text that is not yet copied to pieces.
+        '''
+        log_change = context.log
+        set_line_number = context.set_line_number
+        line_index = first_line_index
+        line_start = start
+        is_budgeted = self.__deadline is not None
+        check_lines = self.BUDGET_CHECK_LINES
+        while True:
+            # split a chunk at a time so that only the lines of one chunk are allocated at once
+            chunk_end = text.rfind("\n", line_start, line_start + self.CHUNK_SIZE) if end - line_start > self.CHUNK_SIZE else -1
+            if chunk_end == -1:
+                chunk_end = end
+            for line in text[line_start:chunk_end].split("\n"):
+                if is_budgeted and line_index % check_lines == 0:
+                    self.__check_budget(line_index)
+                set_line_number(line_index)
+                original = line
+                for operation in operations:
+                    line = operation(line, log_change)
+                if line is not original and line != original:
+                    pieces.append(text[copy_start:line_start])
+                    pieces.append(line)
+                    copy_start = line_start + len(original)
+                line_start += len(original) + 1
+                line_index += 1
+            if is_budgeted:
+                self.__check_budget(line_index - 1)
+            if chunk_end == end:
+                return copy_start
 
-    def __apply_operations(self, line_text, line_number, operations):
-        context = self.FileContext(self.__log_change)
-        for operation in operations:
-            context.set_line_number(line_number)
-            line_text = operation(line_text, context.log)
-        return line_text, context.get_change_count()
+    def __check_budget(self, line_index):
+        '''Aborts (raises) if the time budget is exceeded'''
+        if time.monotonic() > self.__deadline:
+            raise AppException(f"Exceeded time budget of {self.__time_budget}s; aborted at line {line_index + 1}")
 
-    def conform_lines(self, operations):
+    def __find_line_start(self, text, line_count, offset):
+        '''Returns the offset of the start of the line that is line_count lines after offset or -1 if none'''
+        # count newlines a chunk at a time so that skipped lines are not visited one by one
+        chunk_size = 1 << 16
+        while line_count > 0:
+            chunk_line_count = text.count("\n", offset, offset + chunk_size)
+            if chunk_line_count < line_count:
+                if offset + chunk_size >= len(text):
+                    return -1
+                line_count -= chunk_line_count
+                offset += chunk_size
+                continue
+            while line_count > 0:
+                offset = text.index("\n", offset) + 1
+                line_count -= 1
+        return offset
+
+    def __normalize_line_ranges(self, line_ranges):
+        '''Returns line ranges as sorted, non-overlapping (start, end) line indexes (0-based, inclusive)'''
+        merged = []
+        for start, end in sorted(line_ranges):
+            if merged and start <= merged[-1][1] + 2:
+                merged[-1][1] = max(merged[-1][1], end - 1)
+            else:
+                merged.append([start - 1, end - 1])
+        return merged
+
+    def conform_lines(self, operations, line_ranges=None, scan=None):
         '''
         Applies a series of operations to the lines of the loaded cached content
         An operation is a function that accepts a line of text and returns the conformed text
+        Changes are logged as a batch after all lines are conformed
+
+        ### Parameters
+        operations (function[]): Operations to apply to each line
+        line_ranges ((number, number)[]): Limits the lines conformed to (start, end) line numbers (1-based, inclusive);
+        other text is copied as-is without processing
+        scan (function): Called with each line before the last range that is not conformed so that a stateful
+        operation (detab-code) follows the literals of the skipped lines; see LineConformer.get_line_scanner
         '''
-        change_count = 0
-        lines = self.__text.split("\n")
-        conformed_lines = []
-        for count, line in enumerate(lines):
-            conformed_line, line_change_count = self.__apply_operations(line, count, operations)
-            change_count += line_change_count
-            conformed_lines.append(conformed_line)
-        self.__text = "\n".join(conformed_lines)
-        return change_count
+        changes = self.__changes = [] if self.__logger.is_change_logging_enabled else None
+        context = self.FileContext(changes)
+        self.__deadline = None if self.__time_budget is None else time.monotonic() + self.__time_budget
+        text = self.__text
+        pieces = []
+        copy_start = 0
+        if line_ranges is None:
+            copy_start = self.__conform_span(text, 0, len(text), 0, operations, context, pieces, copy_start)
+        else:
+            offset = 0
+            line_index = 0
+            skip_start = 0
+            for start_index, end_index in self.__normalize_line_ranges(line_ranges):
+                range_start = self.__find_line_start(text, start_index - line_index, offset)
+                if range_start == -1:
+                    break
+                range_end = self.__find_line_start(text, end_index - start_index + 1, range_start)
+                range_end = len(text) if range_end == -1 else range_end - 1
+                if scan and range_start > skip_start:
+                    for line in text[skip_start:range_start - 1].split("\n"):
+                        scan(line)
+                copy_start = self.__conform_span(text, range_start, range_end, start_index, operations, context, pieces, copy_start)
+                offset = range_end
+                line_index = end_index
+                skip_start = range_end + 1
+        if pieces:
+            # only changed lines were materialized; the unchanged text between them is copied once here
+            pieces.append(text[copy_start:])
+            self.__text = "".join(pieces)
+            self.__is_modified = True
+        if changes:
+            self.__logger.log_changes(self.__file_path, changes)
+        return context.get_change_count()
     
+class ResultCache(object):
+    '''
+    Content-addressed cache of conform results stored in a directory so that identical content is
+    conformed once; no matter how many paths or checkouts it appears in. The directory can be shared
+    by runs on the same machine. An entry is keyed by a digest of the content, encoding and options
+    and records either that the content is already conformant or the conformed text; and the changes
+    if they were collected for logging.
+    '''
+
+    __slots__ = ["__dir_path", "__hit_count", "__miss_count"]
+
+    # included in each key; change when the format of an entry changes
+    FORMAT_VERSION = 2
+
+    # digest of the source of this script; computed once
+    __script_digest = None
+
+    def __init__(self, dir_path):
+        self.__dir_path = dir_path
+        self.__hit_count = 0
+        self.__miss_count = 0
+        os.makedirs(dir_path, exist_ok=True)
+
+    @property
+    def dir_path(self):
+        return self.__dir_path
+
+    @property
+    def hit_count(self):
+        return self.__hit_count
+
+    @property
+    def miss_count(self):
+        return self.__miss_count
+
+    def get_key(self, content_digest, encoding, options):
+        '''
+        Returns the key for content with conform options
+
+        ### Parameters
+        content_digest (string): Digest of the file content (FileConformer.content_digest)
+        encoding (string): Text encoding of the content
+        options (string): Text that identifies the conform operations
+        '''
+        # the script digest keeps a result of another version (i.e. of a changed engine) from being reused
+        key_text = f"{self.FORMAT_VERSION}\n{self.get_script_digest()}\n{encoding}\n{options}\n{content_digest}"
+        return hashlib.sha256(key_text.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def get_script_digest(cls):
+        '''Returns the digest (SHA-256 hex) of the source of this script'''
+        if cls.__script_digest is None:
+            with open(os.path.abspath(__file__), "rb") as f:
+                cls.__script_digest = hashlib.sha256(f.read()).hexdigest()
+        return cls.__script_digest
+
+    def __get_entry_path(self, key):
+        return os.path.join(self.__dir_path, key[:2], key[2:])
+
+    def load(self, key, with_changes=False):
+        '''
+        Returns the cached (change count, conformed text or None if already conformant, changes or None)
+        or None if not cached
+
+        ### Parameters
+        key (string): Key of the result (get_key)
+        with_changes (bool): Whether the changes are required; a result stored without them is not cached
+        '''
+        try:
+            with open(self.__get_entry_path(key), "rb") as f:
+                header = json.loads(f.readline())
+                change_list = header["change_list"]
+                text = f.read().decode("utf-8") if header["modified"] else None
+        except (OSError, ValueError, KeyError):
+            self.__miss_count += 1
+            return None
+        if with_changes and change_list is None:
+            # stored by a run that did not collect the changes
+            self.__miss_count += 1
+            return None
+        self.__hit_count += 1
+        changes = None if change_list is None else [(line_index, message) for line_index, message in change_list]
+        return header["changes"], text, changes
+
+    def store(self, key, change_count, text, changes=None):
+        '''Stores a result; text is None if the content is already conformant and changes None if not collected'''
+        entry_path = self.__get_entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # write then rename so that a concurrent run never reads a partial entry
+        temp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(json.dumps({"changes": change_count, "modified": text is not None,
+                                "change_list": changes}).encode("utf-8"))
+            f.write(b"\n")
+            if text is not None:
+                f.write(text.encode("utf-8"))
+        os.replace(temp_path, entry_path)
+
+    def __str__(self):
+        return f"{{dir:{self.__dir_path} hits:{self.__hit_count} misses:{self.__miss_count}}}"
+
+class ProgressJournal(object):
+    '''
+    Append-only record of the files completed by a run so that a run that is stopped (i.e. by a CI
+    timeout) can be resumed without repeating work. Each completed file is recorded as a
+    newline-delimited JSON (NDJSON) line with its modification time and size as of completion and
+    is written through immediately; so at most the file being processed when stopped is repeated.
+    A file is considered done only if it has not changed since recorded.
+
+    ### Parameters
+    file_path (string): Path of the journal file
+    options (string): Text that identifies the conform options; a journal only resumes a run with the same options
+    resume (bool): Whether to continue the journal of a previous run; otherwise it is started over
+    '''
+
+    __slots__ = ["__file", "__done_stats_by_path", "__resumed_count"]
+
+    def __init__(self, file_path, options, resume):
+        self.__done_stats_by_path = {}
+        self.__resumed_count = 0
+        is_continued = resume and os.path.isfile(file_path)
+        if is_continued:
+            self.__load(file_path, options)
+        self.__file = open(file_path, "a" if is_continued else "w", encoding="utf-8", newline="\n", buffering=1)
+        if not is_continued:
+            self.__write({"options": options})
+        elif self.__file.tell() > 0:
+            # a run that was stopped while writing leaves a partial last line; start a new one
+            with open(file_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.__file.write("\n")
+
+    @property
+    def resumed_count(self):
+        '''Number of files found done by is_done'''
+        return self.__resumed_count
+
+    def __load(self, file_path, options):
+        with open(file_path, encoding="utf-8", errors="replace") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue # partial line of a stopped run
+                if line_number == 1:
+                    if entry.get("options") != options:
+                        raise AppException(f"{file_path}: Journal is for a run with different options ({entry.get('options')}); omit --resume to start over")
+                elif "path" in entry:
+                    self.__done_stats_by_path[entry["path"]] = (entry.get("mtime_ns"), entry.get("size"))
+
+    def __get_stat(self, file_path):
+        stat = os.stat(file_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def __write(self, entry):
+        self.__file.write(json.dumps(entry, ensure_ascii=False))
+        self.__file.write("\n")
+
+    def is_done(self, file_path):
+        '''Whether a file is recorded as completed and has not changed since'''
+        path = os.path.abspath(file_path)
+        done_stat = self.__done_stats_by_path.get(path)
+        if done_stat is None or done_stat != self.__get_stat(path):
+            return False
+        self.__resumed_count += 1
+        return True
+
+    def record(self, file_path):
+        '''Records a file as completed'''
+        path = os.path.abspath(file_path)
+        mtime_ns, size = self.__get_stat(path)
+        self.__write({"path": path, "mtime_ns": mtime_ns, "size": size})
+
+    def close(self):
+        self.__file.close()
+
+class GitChanges(object):
+    '''
+    Lines changed in the working tree relative to git HEAD.
+    Runs git once per repository; for all files of the repository.
+    '''
+
+    __slots__ = ["__ranges_by_path", "__top_dir_by_dir", "__loaded_top_dirs"]
+
+    __hunk_regex = re.compile(r"^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@", re.MULTILINE)
+
+    def __init__(self):
+        self.__ranges_by_path = {}
+        self.__top_dir_by_dir = {}
+        self.__loaded_top_dirs = set()
+
+    def __run_git(self, dir_path, git_args):
+        # the diff can contain content in any encoding; undecodable bytes round-trip as surrogates (like file names)
+        try:
+            result = subprocess.run(["git", "-c", "core.quotepath=off"] + git_args, cwd=dir_path,
+                                    capture_output=True, text=True, encoding="utf-8", errors="surrogateescape")
+        except OSError as e:
+            raise AppException(f"Failed to run git: {e}")
+        if result.returncode != 0:
+            raise AppException(f"git {' '.join(git_args)} failed in '{dir_path}': {result.stderr.strip()}")
+        return result.stdout
+
+    def __unquote_path(self, path):
+        '''Removes the C-style quoting git uses for a path with special chars'''
+        if path.startswith(DblQuote) and path.endswith(DblQuote):
+            return codecs.escape_decode(path[1:-1].encode("utf-8", "surrogateescape"))[0].decode("utf-8", "surrogateescape")
+        return path
+
+    def __load_repository_of_dir(self, dir_path):
+        '''Loads the changes of the repository that contains a directory; once per repository'''
+        top_dir = self.__top_dir_by_dir.get(dir_path)
+        if top_dir is None:
+            # git resolves symbolic links in the top-level path; so file paths are resolved too
+            top_dir = self.__top_dir_by_dir[dir_path] = os.path.realpath(
+                self.__run_git(dir_path, ["rev-parse", "--show-toplevel"]).strip())
+        if top_dir not in self.__loaded_top_dirs:
+            self.__ranges_by_path.update(self.__load_repository(top_dir))
+            self.__loaded_top_dirs.add(top_dir)
+
+    def __load_repository(self, top_dir):
+        '''Returns the changed line ranges of each changed file of a repository by path'''
+        ranges_by_path = {}
+        # explicit prefixes since configuration (diff.noprefix, diff.mnemonicPrefix) can change them
+        diff = self.__run_git(top_dir, ["diff", "-U0", "--no-color", "--no-ext-diff", "--src-prefix=a/",
+                                        "--dst-prefix=b/", "HEAD", "--"])
+        file_path = None
+        hunk_line_count = 0
+        previous_line = ""
+        for line in diff.split("\n"):
+            if hunk_line_count > 0:
+                # a removed or added line; its content can look like a header
+                if line.startswith(("-", "+")):
+                    hunk_line_count -= 1
+            elif line.startswith("+++ ") and previous_line.startswith("--- "):
+                path = self.__unquote_path(line[4:])
+                file_path = None
+                if path != "/dev/null":
+                    file_path = os.path.normcase(os.path.join(top_dir, path[2:]))
+                    ranges_by_path[file_path] = []
+            elif line.startswith("@@") and file_path:
+                match = self.__hunk_regex.match(line)
+                start = int(match.group(2))
+                count = int(match.group(3) or 1)
+                hunk_line_count = int(match.group(1) or 1) + count
+                if count > 0:
+                    ranges_by_path[file_path].append((start, start + count - 1))
+            previous_line = line
+        untracked = self.__run_git(top_dir, ["ls-files", "--others", "--exclude-standard"])
+        for path in untracked.split("\n"):
+            if path:
+                ranges_by_path[os.path.normcase(os.path.join(top_dir, self.__unquote_path(path)))] = None
+        return ranges_by_path
+
+    def get_line_ranges(self, file_path):
+        '''
+        Returns the changed lines of a file as (start, end) line numbers (1-based, inclusive); None if the
+        whole file is new (untracked) or an empty list if not changed
+        '''
+        file_path = os.path.realpath(file_path)
+        self.__load_repository_of_dir(os.path.dirname(file_path))
+        return self.__ranges_by_path.get(os.path.normcase(file_path), [])
+
+class LiteralRule(object):
+    '''
+    Syntax of a string literal or comment recognized by a CodeGrammar
+
+    ### Parameters
+    start (string): Regex that matches the opening text; must not contain capturing groups
+    closer (string|function|None): Closing text, a function that derives it from the opening text or None to end at end of line
+    tab_text (string|None): Replacement for a tab inside; SPACE to align to tab stops like code; None to leave the tab
+    escapes (bool): Whether backslash escapes the next char
+    multiline (bool): Whether the literal can continue on following lines
+    doubled_escape (bool): Whether a doubled closer is an escaped closer (C# verbatim string)
+    accepts (function|None): Whether a match of start at an index of a line opens the literal (line, index); None for always
+    closes_on_line (bool): Whether the opening text is code unless the literal closes on the same line
+    '''
+
+    __slots__ = ["start", "closer", "tab_text", "escapes", "multiline", "doubled_escape", "accepts", "closes_on_line"]
+
+    def __init__(self, start, closer, tab_text=r"\t", escapes=True, multiline=False, doubled_escape=False,
+                 accepts=None, closes_on_line=False):
+        self.start = start
+        self.closer = closer
+        self.tab_text = tab_text
+        self.escapes = escapes
+        self.multiline = multiline
+        self.doubled_escape = doubled_escape
+        self.accepts = accepts
+        self.closes_on_line = closes_on_line
+
+# JavaScript keywords after which an expression (so a regex literal) is expected
+_JAVASCRIPT_EXPRESSION_KEYWORDS = {"return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void",
+                                   "throw", "instanceof", "yield", "await"}
+
+def _is_javascript_regex_start(line, index):
+    '''Whether the '/' at an index of a line starts a regex literal instead of being division; by the previous token'''
+    end = index
+    while end > 0 and line[end - 1].isspace():
+        end -= 1
+    if end == 0:
+        # a line that starts with '/' more likely continues an expression of the previous line
+        return False
+    last = line[end - 1]
+    if last.isalnum() or last in "_$":
+        start = end - 1
+        while start > 0 and (line[start - 1].isalnum() or line[start - 1] in "_$"):
+            start -= 1
+        return line[start:end] in _JAVASCRIPT_EXPRESSION_KEYWORDS
+    # after an operand, a postfix ++/-- or a JSX tag opener (</div>) it is not a regex
+    return last not in ")]<" and line[end - 2:end] not in ("++", "--")
+
+def _strip_string_prefix(opening):
+    return opening.lstrip("rRbBuUfF")
+
+def _get_cpp_raw_closer(opening):
+    return ")" + opening[opening.index(DblQuote) + 1:-1] + DblQuote
+
+_C_COMMENT_RULES = [
+    LiteralRule(r"//", None, tab_text=SPACE, escapes=False),
+    LiteralRule(r"/\*", "*/", tab_text=SPACE, escapes=False, multiline=True),
+]
+
+_CODE_LANGUAGE_RULES = {
+    "generic": [
+        LiteralRule(r'"', DblQuote),
+        LiteralRule(r"'", SglQuote),
+    ],
+    "c": _C_COMMENT_RULES + [
+        LiteralRule(r'(?<![A-Za-z0-9_])(?:u8|u|U|L)?R"[^()\\ \t"]{0,16}\(', _get_cpp_raw_closer, tab_text=None, escapes=False, multiline=True),
+        LiteralRule(r'"', DblQuote),
+        LiteralRule(r"(?<![0-9A-Fa-f])'", SglQuote), # not a C++14 digit separator
+    ],
+    "csharp": _C_COMMENT_RULES + [
+        LiteralRule(r'"{3,}', lambda opening: opening, tab_text=None, escapes=False, multiline=True),
+        LiteralRule(r'(?:\$@|@\$?)"', DblQuote, tab_text=None, escapes=False, multiline=True, doubled_escape=True),
+        LiteralRule(r'"', DblQuote),
+        LiteralRule(r"'", SglQuote),
+    ],
+    "python": [
+        LiteralRule(r"#", None, tab_text=SPACE, escapes=False),
+        LiteralRule(r'(?<![A-Za-z0-9_])(?:[rR][bBfF]?|[bBfF][rR])(?:"""|' + r"''')", _strip_string_prefix, tab_text=None, multiline=True),
+        LiteralRule(r'(?<![A-Za-z0-9_])(?:[rR][bBfF]?|[bBfF][rR])["' + r"']", _strip_string_prefix, tab_text=None),
+        LiteralRule(r'(?:"""|' + r"''')", _strip_string_prefix, multiline=True),
+        LiteralRule(r'"', DblQuote),
+        LiteralRule(r"'", SglQuote),
+    ],
+    "javascript": _C_COMMENT_RULES + [
+        LiteralRule(r'"', DblQuote),
+        LiteralRule(r"'", SglQuote),
+        LiteralRule(r"`", "`", multiline=True),
+        LiteralRule(r"/", "/", accepts=_is_javascript_regex_start, closes_on_line=True),
+    ],
+    "go": _C_COMMENT_RULES + [
+        LiteralRule(r'"', DblQuote),
+        LiteralRule(r"'", SglQuote),
+        LiteralRule(r"`", "`", tab_text=None, escapes=False, multiline=True),
+    ],
+}
+
+_CODE_LANGUAGE_EXTENSIONS = {
+    "c": [".c", ".h", ".cpp", ".cc", ".cxx", ".c++", ".hpp", ".hh", ".hxx", ".h++", ".inl", ".ipp", ".ino"],
+    "csharp": [".cs"],
+    "python": [".py", ".pyw", ".pyi"],
+    "javascript": [".js", ".mjs", ".cjs", ".jsx", ".ts", ".mts", ".cts", ".tsx"],
+    "go": [".go"],
+}
+
+class CodeGrammar(object):
+    '''
+    String literal and comment syntax of a programming language compiled into a single regex that
+    finds the start of the next literal or comment so that the text between them is skipped at C speed.
+    Grammars are compiled once and cached per file extension.
+    '''
+
+    __slots__ = ["__language", "__rules", "__start_regex", "__closer_regexes", "__is_multiline"]
+
+    __grammars_by_language = {}
+    __grammars_by_extension = {}
+
+    def __init__(self, language, rules):
+        self.__language = language
+        self.__rules = {f"r{i}": rule for i, rule in enumerate(rules)}
+        self.__start_regex = re.compile("|".join(f"(?P<{key}>{rule.start})" for key, rule in self.__rules.items()))
+        self.__closer_regexes = {}
+        self.__is_multiline = any(rule.multiline for rule in rules)
+
+    @property
+    def language(self):
+        return self.__language
+
+    @property
+    def start_regex(self):
+        '''Regex that matches the opening text of any literal or comment'''
+        return self.__start_regex
+
+    @property
+    def is_multiline(self):
+        '''Whether any literal or comment can span lines'''
+        return self.__is_multiline
+
+    def get_rule(self, start_match):
+        '''Returns the rule for a match of start_regex'''
+        return self.__rules[start_match.lastgroup]
+
+    def get_closer_regex(self, rule, closer):
+        '''Returns a (cached) regex that matches from inside a literal through its closer'''
+        key = (rule.escapes, rule.doubled_escape, closer)
+        regex = self.__closer_regexes.get(key)
+        if regex is None:
+            regex = self.__closer_regexes[key] = re.compile(self.__get_closer_pattern(rule, closer), re.DOTALL)
+        return regex
+
+    def __get_closer_pattern(self, rule, closer):
+        # unrolled loops keep matching linear even when there is no closer
+        quoted_closer = re.escape(closer)
+        first = re.escape(closer[0])
+        if rule.doubled_escape:
+            # the closer must not be the first of a doubled closer
+            return f"[^{first}]*(?:{quoted_closer}{quoted_closer}[^{first}]*)*{quoted_closer}(?!{quoted_closer})"
+        if rule.escapes:
+            special = r"\\." if len(closer) == 1 else rf"\\.|{first}(?!{re.escape(closer[1:])})"
+            return rf"[^\\{first}]*(?:(?:{special})[^\\{first}]*)*{quoted_closer}"
+        return f".*?{quoted_closer}"
+
+    @classmethod
+    def for_language(cls, language):
+        '''Returns the grammar for a language name; a key of _CODE_LANGUAGE_RULES'''
+        grammar = cls.__grammars_by_language.get(language)
+        if grammar is None:
+            grammar = cls.__grammars_by_language[language] = CodeGrammar(language, _CODE_LANGUAGE_RULES[language])
+        return grammar
+
+    @classmethod
+    def for_file(cls, file_path):
+        '''Returns the grammar for the extension of a file path; the generic grammar for an unknown extension'''
+        extension = os.path.splitext(file_path)[1].lower()
+        grammar = cls.__grammars_by_extension.get(extension)
+        if grammar is None:
+            language = next((language for language, extensions in _CODE_LANGUAGE_EXTENSIONS.items() if extension in extensions), "generic")
+            grammar = cls.__grammars_by_extension[extension] = cls.for_language(language)
+        return grammar
+
+class CodeScanner(object):
+    '''
+    Detabs lines of code with special handling for the string literals and comments of a CodeGrammar.
+    Jumps from literal to literal via regex search instead of inspecting each char and keeps the
+    state of an open literal or comment across lines.
+    '''
+
+    __slots__ = ["__grammar", "__open_rule", "__open_closer", "__open_closer_regex"]
+
+    def __init__(self):
+        self.__grammar = CodeGrammar.for_language("generic")
+        self.__open_rule = None
+        self.__open_closer = None
+        self.__open_closer_regex = None
+
+    @property
+    def grammar(self):
+        return self.__grammar
+
+    def start_file(self, file_path):
+        '''Selects the grammar for a file and resets literal state'''
+        self.__grammar = CodeGrammar.for_file(file_path)
+        self.__open_rule = None
+        self.__open_closer = None
+        self.__open_closer_regex = None
+
+    def detab(self, line, log_change, tab_size):
+        '''Replaces tabs with spaces aligned with tab stops in code and with an escape sequence in string literals'''
+        return self.__scan(line, log_change, tab_size, TAB in line)
+
+    def scan(self, line):
+        '''Follows the literals and comments of a line without changing it; for a line that is not detabbed'''
+        self.__scan(line, None, 1, False)
+
+    def __scan(self, line, log_change, tab_size, has_tab):
+        '''Follows the literals and comments of a line and, if has_tab, returns it detabbed'''
+        grammar = self.__grammar
+        rule = self.__open_rule
+        # a line can only leave a literal open if the grammar is multiline or by a final escape
+        if not has_tab and rule is None and not grammar.is_multiline and not line.endswith(ESCAPE):
+            return line
+        closer = self.__open_closer
+        closer_regex = self.__open_closer_regex
+        pieces = []
+        out_len = 0
+        pos = 0
+        end = len(line)
+        while True:
+            if rule is None:
+                match = grammar.start_regex.search(line, pos)
+                stop = match.start() if match else end
+                if has_tab:
+                    out_len = self.__write(pieces, out_len, line[pos:stop], SPACE, log_change, tab_size)
+                if not match:
+                    break
+                rule = grammar.get_rule(match)
+                opening = match.group()
+                pos = match.end()
+                closer = rule.closer(opening) if callable(rule.closer) else rule.closer
+                closer_regex = grammar.get_closer_regex(rule, closer) if closer else None
+                if (rule.accepts and not rule.accepts(line, match.start())) or \
+                        (rule.closes_on_line and not closer_regex.match(line, pos)):
+                    # the opening text is code (i.e. JavaScript division)
+                    rule = None
+                    if has_tab:
+                        out_len = self.__write(pieces, out_len, opening, SPACE, log_change, tab_size)
+                    continue
+                if has_tab:
+                    pieces.append(opening)
+                    out_len += len(opening)
+            else:
+                match = closer_regex.match(line, pos) if closer_regex else None
+                stop = match.end() if match else end
+                if has_tab:
+                    out_len = self.__write(pieces, out_len, line[pos:stop], rule.tab_text, log_change, tab_size)
+                pos = stop
+                if match:
+                    rule = None
+                    continue
+                if not closer_regex:
+                    rule = None
+                elif not rule.multiline and not self.__ends_with_escape(line, rule):
+                    if has_tab:
+                        log_change(f"Warning: Unmatched string delim ({closer}) in line: '{line}'")
+                    rule = None
+                break
+        self.__open_rule = rule
+        self.__open_closer = closer if rule else None
+        self.__open_closer_regex = closer_regex if rule else None
+        return "".join(pieces) if has_tab else line
+
+    def __ends_with_escape(self, line, rule):
+        '''Whether a line ends with an unescaped backslash which continues a literal on the next line'''
+        return rule.escapes and (len(line) - len(line.rstrip(ESCAPE))) % 2 == 1
+
+    def __write(self, pieces, out_len, text, tab_text, log_change, tab_size):
+        '''Appends text to pieces with tabs replaced according to tab_text; returns the new output length'''
+        if tab_text is None or not TAB in text:
+            pieces.append(text)
+            return out_len + len(text)
+        if tab_text != SPACE:
+            for _ in range(text.count(TAB)):
+                log_change(f"Replaced tab with {tab_text} in string literal")
+            text = text.replace(TAB, tab_text)
+            pieces.append(text)
+            return out_len + len(text)
+        parts = text.split(TAB)
+        for part in parts[:-1]:
+            out_len += len(part)
+            spaces = SPACE * (tab_size - out_len % tab_size)
+            pieces.append(part)
+            pieces.append(spaces)
+            out_len += len(spaces)
+            log_change("Replaced tab with spaces")
+        pieces.append(parts[-1])
+        return out_len + len(parts[-1])
+
+class IndentCache(object):
+    '''
+    Bounded LRU cache of indentation (leading whitespace) conversions.
+    Maps (leading whitespace, tab size, operation) to the converted text and the change messages
+    so that converting the indentation of a line that repeats a previous one is a dict lookup.
+    '''
+
+    __slots__ = ["__max_size", "__entries", "__hit_count", "__miss_count"]
+
+    def __init__(self, max_size=4096):
+        if max_size < 1:
+            raise AppException("Indent cache size minimum is 1")
+        self.__max_size = max_size
+        self.__entries = collections.OrderedDict()
+        self.__hit_count = 0
+        self.__miss_count = 0
+
+    @property
+    def max_size(self):
+        return self.__max_size
+
+    @property
+    def hit_count(self):
+        return self.__hit_count
+
+    @property
+    def miss_count(self):
+        return self.__miss_count
+
+    @property
+    def hit_rate(self):
+        '''Fraction of lookups found in the cache'''
+        lookup_count = self.__hit_count + self.__miss_count
+        return self.__hit_count / lookup_count if lookup_count else 0.0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def convert(self, leading, tab_size, operation_name, convert):
+        '''
+        Returns the converted leading whitespace and the change messages; from the cache if available
+
+        ### Parameters
+        leading (string): Leading whitespace of a line
+        tab_size (number): Tab size
+        operation_name (string): Name of the conversion; part of the key
+        convert (function): Converts leading whitespace; called as convert(leading, log_change, tab_size) for a miss
+        '''
+        key = (leading, tab_size, operation_name)
+        entry = self.__entries.get(key)
+        if entry is not None:
+            self.__hit_count += 1
+            self.__entries.move_to_end(key)
+            return entry
+        self.__miss_count += 1
+        messages = []
+        entry = self.__entries[key] = (convert(leading, messages.append, tab_size), tuple(messages))
+        if len(self.__entries) > self.__max_size:
+            self.__entries.popitem(last=False)
+        return entry
+
+    def __str__(self):
+        return f"{{size:{len(self)} hits:{self.__hit_count} misses:{self.__miss_count} hit_rate:{self.hit_rate:.1%}}}"
+
 class LineConformer(object):
     '''Utilities for editing lines of code'''
 
-    __slots__ = ["__logger", "__debugging"]
+    __slots__ = ["__logger", "__debugging", "__code_scanner", "__indent_cache", "__operations_by_profile"]
 
-    def __init__(self):
+    def __init__(self, indent_cache=None):
         self.__debugging = False
+        self.__code_scanner = CodeScanner()
+        self.__indent_cache = IndentCache() if indent_cache is None else indent_cache
+        self.__operations_by_profile = {}
+
+    @property
+    def indent_cache(self):
+        '''Cache of leading whitespace conversions; shared by all files conformed'''
+        return self.__indent_cache
     
     def __log_debug(self, message):
         print(f"\n {message}")
 
-    def __find_first_non_whitespace(self, line):
-        for i, c in enumerate(line):
-            if c != SPACE and c != TAB: return i
-        return -1
-    
-    def __split_leading_whitespace(self, line):
-        nonWsPos = self.__find_first_non_whitespace(line)
-        if nonWsPos == -1:
-            return line, ""
-        return line[:nonWsPos], line[nonWsPos:]
+    def __convert_leading(self, line, log_change, tab_size, operation_name, convert):
+        '''Replaces the leading whitespace of a line with its conversion via the indent cache'''
+        leading_len = len(line) - len(line.lstrip(SPACE + TAB))
+        if leading_len == 0:
+            return line
+        leading = line[:leading_len]
+        new_leading, messages = self.__indent_cache.convert(leading, tab_size, operation_name, convert)
+        for message in messages:
+            log_change(message)
+        if new_leading == leading:
+            return line
+        return new_leading + line[leading_len:]
 
     def __get_spaces_to_next_tab_stop(self, line_len, tab_size):
         return SPACE * (tab_size - line_len % tab_size)
@@ -145,9 +1197,7 @@ class LineConformer(object):
     
     def detab_leading(self, line, log_change, tab_size):
         '''Replaces tabs in indentation text of a line with spaces aligned with tab stops equally spaced by tab_size.'''
-        leading_whitespace, post_leading = self.__split_leading_whitespace(line)
-        detabbed_leading = self.detab_line(leading_whitespace, log_change, tab_size)
-        return detabbed_leading + post_leading
+        return self.__convert_leading(line, log_change, tab_size, "detab", self.detab_line)
     
     def detab_line(self, line, log_change, tab_size):
         '''
@@ -156,6 +1206,11 @@ class LineConformer(object):
         '''
         if not TAB in line:
             return line
+        if not "\r" in line:
+            # expandtabs is equivalent (at C speed) except that it restarts columns after a CR
+            for _ in range(line.count(TAB)):
+                log_change(f"Replaced tab with spaces")
+            return line.expandtabs(tab_size)
         out_line = io.StringIO()
         for c in line:
             if c == TAB:
@@ -168,72 +1223,61 @@ class LineConformer(object):
     def detab_code_line(self, line, log_change, tab_size):
         '''
         Replaces tabs in text with spaces aligned with tab stops equally spaced by tab_size.
-        Attempts to handle string literals for programming languages such as C, C++, C#, Python
-        and languages with similar string literal syntax.
-        A string literal beginning is either a single or double quote and then ends when the same
-        quote char is found later but not escaped with backslash.
-        The non-starting quote char is ignored inside a string literal like in Python.
-        This logic also allows for C/C++ literals; both string (double-quoted) and char (single-quoted)
+        Handles string literals and comments according to the grammar selected by start_file
+        (by file extension) for languages such as C, C++, C#, Python, JavaScript and Go. For other
+        files, a string literal begins with either a single or double quote and then ends when the
+        same quote char is found later but not escaped with backslash.
+        Literal and comment state is kept across lines so that multi-line literals (such as Python
+        triple-quoted strings and C++ raw strings) and block comments are followed.
+        A tab in a raw string literal is left as-is since an escape sequence is not supported there.
+        '''
+        return self.__code_scanner.detab(line, log_change, tab_size)
 
-        ### Known limitation
-        Does _not_ handle raw literals (marked with r in Python and R in C++)
+    def get_line_scanner(self, profile):
         '''
-        if not TAB in line:
-            return line
-        out_line = io.StringIO()
-        literalTabSpecifier = r"\t"
-        inStringLiteral = False
-        startLiteralQuote = None
-        escapeNext = False
-        for c in line:
-            if self.__debugging: self.__log_debug(f"char: '{c}'")
-            if c == ESCAPE:
-                if inStringLiteral:
-                    if escapeNext:
-                        if self.__debugging: self.__log_debug(r"escaped escape: \\")
-                    else:
-                        if self.__debugging: self.__log_debug("escape (without preceding escape)")
-                        escapeNext = True
-                        out_line.write(c)
-                        continue
-                out_line.write(c)
-            elif c == SglQuote or c == DblQuote:
-                if not escapeNext:
-                    if inStringLiteral:
-                        if c == startLiteralQuote:
-                            inStringLiteral = False
-                            startLiteralQuote = None
-                            if self.__debugging: self.__log_debug("end string literal")
-                    else:
-                        inStringLiteral = True
-                        startLiteralQuote = c
-                        if self.__debugging: self.__log_debug("start string literal")
-                out_line.write(c)
-            elif c == TAB:
-                if inStringLiteral:
-                    out_line.write(literalTabSpecifier)
-                    msg = f"Replaced tab with {literalTabSpecifier} in string literal"
-                    log_change(msg)
-                    if self.__debugging: self.__log_debug(msg)
-                else:
-                    out_line.write(self.__get_spaces_to_next_tab_stop(out_line.tell(), tab_size))
-                    msg = "Replaced tab with spaces"
-                    log_change(msg)
-                    if self.__debugging: self.__log_debug(msg)
-            else:
-                out_line.write(c)
-            escapeNext = False
-        if inStringLiteral:
-            msg = f"Warning: Unmatched string delim ({startLiteralQuote}) in line: '{line}'"
-            if self.__debugging: self.__log_debug(msg)
-            log_change(msg)
-        return out_line.getvalue()
+        Returns the function that keeps the state of the operations of a profile up to date for a line
+        that is not conformed (for FileConformer.conform_lines) or None if the operations have no state
+        '''
+        return self.__code_scanner.scan if profile.tab_operation == "detab-code" else None
+
+    def start_file(self, file_path):
+        '''Prepares for conforming the lines of a file; selects the code grammar by file extension'''
+        self.__code_scanner.start_file(file_path)
+
+    @property
+    def code_grammar(self):
+        '''Grammar used by detab_code_line; selected by start_file'''
+        return self.__code_scanner.grammar
+
+    def get_operations(self, profile):
+        '''
+        Returns the line operations (for FileConformer.conform_lines) of an OperationProfile.
+        Created once per profile and then shared by all files that use the profile.
+        '''
+        operations = self.__operations_by_profile.get(profile.key)
+        if operations is not None:
+            return operations
+        operations = []
+        if not profile.leave_trailing:
+            operations.append(self.trim_trailing)
+        tab_operation = profile.tab_operation
+        tab_size = profile.tab_size
+        if tab_operation == "detab-leading":
+            operations.append(lambda line, log: self.detab_leading(line, log, tab_size))
+        elif tab_operation == "detab-text":
+            operations.append(lambda line, log: self.detab_line(line, log, tab_size))
+        elif tab_operation == "detab-code":
+            operations.append(lambda line, log: self.detab_code_line(line, log, tab_size))
+        elif tab_operation == "entab-leading":
+            operations.append(lambda line, log: self.entab_leading(line, log, tab_size))
+        elif tab_operation != "none":
+            raise AppException(f"Operation '{tab_operation}' is not supported")
+        self.__operations_by_profile[profile.key] = operations
+        return operations
     
     def entab_leading(self, line, log_change, tab_size):
         '''Replaces spaces in leading whitespace with tabs according to tab stops spaced equally by tab_size'''
-        leading_whitespace, post_leading = self.__split_leading_whitespace(line)
-        new_leading = self.__entab_line(leading_whitespace, log_change, tab_size)
-        return new_leading + post_leading
+        return self.__convert_leading(line, log_change, tab_size, "entab", self.__entab_line)
     
     def __entab_line(self, line, log_change, tab_size):
         '''
@@ -279,17 +1323,320 @@ class LineConformer(object):
                 logical_len += 1
         return out_line.getvalue()
     
+TAB_OPERATION_INFOS = [
+    ("none", "Use to _only_ remove trailing whitespace"),
+    ("detab-leading", "Replace tabs with spaces before the first non-whitespace character"),
+    ("detab-text", "Replace tabs with spaces throughout; no special handing for string literals"),
+    ("detab-code", "Replace tabs with spaces throughout; replace tabs in string literals with \\t"),
+    ("entab-leading", "Replace spaces with tabs before the first non-whitespace character"),
+   #("entab-text" "Replace spaces with tabls throughout; no special handing for string literals"),
+   #("entab-code" "FUTURE: Replace spaces with tabs throughout while ignoring string literals"),
+]
+
+TAB_OPERATIONS = [i[0] for i in TAB_OPERATION_INFOS]
+
+class OperationProfile(object):
+    '''
+    Settings for conforming a set of files: tab operation, tab size and whether to leave trailing whitespace
+
+    ### Parameters
+    tab_operation (string): One of TAB_OPERATIONS
+    tab_size (number): Number of spaces for a tab
+    leave_trailing (bool): Whether to leave trailing whitespace instead of trimming
+    '''
+
+    __slots__ = ["__tab_operation", "__tab_size", "__leave_trailing"]
+
+    def __init__(self, tab_operation="detab-leading", tab_size=4, leave_trailing=False):
+        if not tab_operation in TAB_OPERATIONS:
+            raise AppException(f"Unknown operation '{tab_operation}', supported operations: {', '.join(TAB_OPERATIONS)}")
+        if tab_size < 1:
+            raise AppException("Tab size minimum is 1")
+        self.__tab_operation = tab_operation
+        self.__tab_size = tab_size
+        self.__leave_trailing = bool(leave_trailing)
+
+    @property
+    def tab_operation(self):
+        return self.__tab_operation
+
+    @property
+    def tab_size(self):
+        return self.__tab_size
+
+    @property
+    def leave_trailing(self):
+        return self.__leave_trailing
+
+    @property
+    def key(self):
+        '''Identifies the settings; equal for profiles with the same settings'''
+        return (self.__tab_operation, self.__tab_size, self.__leave_trailing)
+
+    def __str__(self):
+        return f"{self.__tab_operation} tab_size:{self.__tab_size} leave_trailing:{self.__leave_trailing}"
+
+class ConfigResolver(object):
+    '''
+    Resolves the OperationProfile of a file from the config files (named .better-space) of its
+    directory and the directories above it. A config file maps file name patterns to settings; the
+    settings of a config file in a subdirectory override those of config files above it and a
+    later section overrides an earlier one. Settings specified on the command line (overrides)
+    take precedence over config files.
+
+    The rules that apply to a directory are resolved once and cached, so resolving the profile
+    of a file only matches its name against the patterns. Profiles are shared by all files with
+    the same settings.
+
+    Format:
+
+        root = true             # optional; ignore config files in the directories above
+        [*.py]                  # wildcard pattern; matches the file name, or the path relative
+        tab-size = 4            # to the config file directory if it contains /
+        [Makefile]
+        tab-operation = entab-leading
+        [vendor/*]
+        tab-operation = none
+        leave-trailing = true
+
+    ### Parameters
+    default_profile (OperationProfile): Profile for settings not specified by a config file
+    overrides (dict): Settings that take precedence over config files; keys such as "tab-size"
+    '''
+
+    FILE_NAME = ".better-space"
+    SETTING_NAMES = ["tab-operation", "tab-size", "leave-trailing"]
+
+    __slots__ = ["__default_profile", "__overrides", "__rules_by_dir", "__profiles_by_key"]
+
+    def __init__(self, default_profile, overrides=None):
+        self.__default_profile = default_profile
+        self.__overrides = dict(overrides or {})
+        self.__rules_by_dir = {}
+        self.__profiles_by_key = {default_profile.key: default_profile}
+
+    @property
+    def default_profile(self):
+        return self.__default_profile
+
+    @property
+    def config_count(self):
+        '''Number of directories searched for a config file'''
+        return len(self.__rules_by_dir)
+
+    def get_profile(self, file_path):
+        '''Returns the profile for a file'''
+        file_path = os.path.abspath(file_path)
+        rules = self.__get_rules(os.path.dirname(file_path))
+        if not rules:
+            return self.__get_profile({})
+        file_name = os.path.basename(file_path)
+        settings = {}
+        for regex, dir_prefix, rule_settings in rules:
+            if regex.match(file_name if dir_prefix is None else dir_prefix + file_name):
+                settings.update(rule_settings)
+        return self.__get_profile(settings)
+
+    def __get_profile(self, settings):
+        settings.update(self.__overrides)
+        default = self.__default_profile
+        key = (settings.get("tab-operation", default.tab_operation),
+               settings.get("tab-size", default.tab_size),
+               settings.get("leave-trailing", default.leave_trailing))
+        profile = self.__profiles_by_key.get(key)
+        if profile is None:
+            profile = self.__profiles_by_key[key] = OperationProfile(*key)
+        return profile
+
+    def __get_rules(self, dir_path):
+        '''
+        Returns the rules that apply to the files of a directory as a list of (regex, dir_prefix, settings)
+        in order of precedence; dir_prefix is the path of the directory relative to the config file
+        directory for a pattern that matches a relative path or None for a pattern that matches a file name
+        '''
+        rules = self.__rules_by_dir.get(dir_path)
+        if rules is not None:
+            return rules
+        is_root, own_rules = self.load_config(os.path.join(dir_path, ConfigResolver.FILE_NAME))
+        parent_path = os.path.dirname(dir_path)
+        rules = []
+        if not is_root and parent_path != dir_path:
+            dir_name = os.path.basename(dir_path)
+            for regex, dir_prefix, settings in self.__get_rules(parent_path):
+                rules.append((regex, None if dir_prefix is None else f"{dir_prefix}{dir_name}/", settings))
+        rules.extend(own_rules)
+        self.__rules_by_dir[dir_path] = rules
+        return rules
+
+    @staticmethod
+    def load_config(config_path):
+        '''
+        Returns (is_root, rules) for a config file; (False, []) if there is no config file
+
+        ### Parameters
+        config_path (string): Path of the config file
+        '''
+        if not os.path.isfile(config_path):
+            return False, []
+        is_root = False
+        rules = []
+        settings = None
+        with open(config_path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                line = re.sub(r"\s[#;].*", "", line).strip()
+                if not line or line[0] in "#;":
+                    continue
+                if line.startswith("[") and line.endswith("]"):
+                    pattern = line[1:-1].strip().lstrip("/")
+                    if not pattern:
+                        raise AppException(f"{config_path}:{line_number}: Empty pattern")
+                    settings = {}
+                    rules.append((re.compile(fnmatch.translate(pattern)), "" if "/" in pattern else None, settings))
+                    continue
+                name, sep, value = line.partition("=")
+                name = name.strip().lower()
+                value = value.strip()
+                if not sep:
+                    raise AppException(f"{config_path}:{line_number}: Expected [pattern] or name = value")
+                if settings is None:
+                    if name != "root":
+                        raise AppException(f"{config_path}:{line_number}: Unknown setting '{name}' before first [pattern]")
+                    is_root = ConfigResolver.__parse_bool(config_path, line_number, value)
+                elif name == "tab-operation":
+                    if not value in TAB_OPERATIONS:
+                        raise AppException(f"{config_path}:{line_number}: Unknown operation '{value}', supported operations: {', '.join(TAB_OPERATIONS)}")
+                    settings[name] = value
+                elif name == "tab-size":
+                    if not value.isdigit() or int(value) < 1:
+                        raise AppException(f"{config_path}:{line_number}: Tab size must be a number 1 or more; found '{value}'")
+                    settings[name] = int(value)
+                elif name == "leave-trailing":
+                    settings[name] = ConfigResolver.__parse_bool(config_path, line_number, value)
+                else:
+                    raise AppException(f"{config_path}:{line_number}: Unknown setting '{name}', supported: {', '.join(ConfigResolver.SETTING_NAMES)}")
+        return is_root, rules
+
+    @staticmethod
+    def __parse_bool(config_path, line_number, value):
+        if value.lower() in ("true", "yes", "1"):
+            return True
+        if value.lower() in ("false", "no", "0"):
+            return False
+        raise AppException(f"{config_path}:{line_number}: Expected true or false; found '{value}'")
+
+class WhitespaceAuditor(object):
+    '''
+    Scans files for whitespace properties without transforming them; for a census before a migration.
+    Counts are made with regex scans of the whole file content instead of processing each line.
+    Also determines which tab operations (and trimming) would change a file.
+    '''
+
+    __slots__ = ["__totals", "__file_count"]
+
+    INDENT_STYLES = ["tabs", "spaces", "mixed", "none"]
+
+    __tab_indented_regex = re.compile(r"^\t", re.MULTILINE)
+    __space_indented_regex = re.compile(r"^ ", re.MULTILINE)
+    __mixed_indented_regex = re.compile(r"^[ \t]*(?: \t|\t )", re.MULTILINE)
+    __leading_tab_regex = re.compile(r"^[ \t]*\t", re.MULTILINE)
+    # whitespace other than a new line; the same chars as str.rstrip removes when trimming
+    __trailing_regex = re.compile(r"[^\S\n]+$", re.MULTILINE)
+    # entab-leading replaces or drops each space of leading whitespace
+    __leading_space_regex = re.compile(r"^\t* ", re.MULTILINE)
+
+    def __init__(self):
+        self.__totals = collections.Counter()
+        self.__file_count = 0
+
+    @property
+    def totals(self):
+        '''Aggregate statistics of the files audited'''
+        return self.__totals
+
+    @property
+    def file_count(self):
+        return self.__file_count
+
+    def audit_text(self, text):
+        '''
+        Returns the statistics of text
+
+        ### Returns
+        dict: lines, tab_indented, space_indented, mixed_indented, trailing (line counts), tabs (char count),
+        indent (one of INDENT_STYLES) and would_change (names of tab operations and "trim" that would change the text)
+        '''
+        tab_indented = len(self.__tab_indented_regex.findall(text))
+        space_indented = len(self.__space_indented_regex.findall(text))
+        mixed_indented = len(self.__mixed_indented_regex.findall(text))
+        trailing = len(self.__trailing_regex.findall(text))
+        tabs = text.count(TAB)
+        if mixed_indented or (tab_indented and space_indented):
+            indent = "mixed"
+        elif tab_indented:
+            indent = "tabs"
+        elif space_indented:
+            indent = "spaces"
+        else:
+            indent = "none"
+        would_change = []
+        if trailing:
+            would_change.append("trim")
+        if self.__leading_tab_regex.search(text):
+            would_change.append("detab-leading")
+        if tabs:
+            # detab-code leaves tabs in raw literals; not distinguished here
+            would_change += ["detab-text", "detab-code"]
+        if self.__leading_space_regex.search(text):
+            would_change.append("entab-leading")
+        line_count = text.count("\n") + (1 if text and not text.endswith("\n") else 0)
+        return {"lines": line_count, "tab_indented": tab_indented, "space_indented": space_indented,
+                "mixed_indented": mixed_indented, "trailing": trailing, "tabs": tabs,
+                "indent": indent, "would_change": would_change}
+
+    def audit_file(self, file_conformer, file_path, encoding):
+        '''Returns the statistics of a file (see audit_text) and adds them to totals'''
+        file_conformer.load_from_file(file_path, encoding)
+        stats = self.audit_text(file_conformer.text)
+        self.__file_count += 1
+        totals = self.__totals
+        for key in ["lines", "tab_indented", "space_indented", "mixed_indented", "trailing", "tabs"]:
+            totals[key] += stats[key]
+        totals["indent " + stats["indent"]] += 1
+        if stats["trailing"]:
+            totals["files with trailing"] += 1
+        for operation in stats["would_change"]:
+            totals["changed by " + operation] += 1
+        return stats
+
+    def format_stats(self, stats):
+        return (f"indent:{stats['indent']} lines:{stats['lines']} tab-indented:{stats['tab_indented']} "
+                f"space-indented:{stats['space_indented']} mixed-indented:{stats['mixed_indented']} "
+                f"trailing:{stats['trailing']} would-change:{','.join(stats['would_change']) or '-'}")
+
+    def format_totals(self):
+        totals = self.__totals
+        indents = ", ".join(f"{totals['indent ' + style]} {style}" for style in self.INDENT_STYLES)
+        changes = ", ".join(f"{operation}: {totals['changed by ' + operation]}"
+                            for operation in ["trim", "detab-leading", "detab-text", "detab-code", "entab-leading"])
+        return (f"Files audited: {self.__file_count}; lines: {totals['lines']}\n"
+                f"Indentation: {indents}\n"
+                f"Lines indented with tab: {totals['tab_indented']}; with space: {totals['space_indented']}; "
+                f"mixed: {totals['mixed_indented']}\n"
+                f"Trailing whitespace: {totals['trailing']} lines in {totals['files with trailing']} files\n"
+                f"Files changed by: {changes}")
+
 class FileSelect(object):
     '''
     Specifies file selection criteria.
     Defaults to selecting all files of a directoy and all levels of sub-directories.
     '''
 
-    __slots__ = ["__depth_limit", "__match_patterns"]
+    __slots__ = ["__depth_limit", "__match_patterns", "__shard"]
 
     def __init__(self):
         self.__match_patterns = ["*"]
         self.__depth_limit = sys.maxsize
+        self.__shard = None
 
     @property
     def match_patterns(self):
@@ -312,21 +1659,327 @@ class FileSelect(object):
             raise AppException("Depth limit minimum is 0")
         self.__depth_limit = bool(to)
 
+    @property
+    def shard(self):
+        '''Share of the found files to select (FileShard) or None for all'''
+        return self.__shard
+    @shard.setter
+    def shard(self, to):
+        self.__shard = to
+
+    def __str__(self):
+        return f"{{match_patterns:{self.match_patterns} depth_limit:{self.depth_limit} shard:{self.shard}}}"
+
+class FileShard(object):
+    '''
+    Selects a deterministic share of files so that runs on separate machines (i.e. CI runners)
+    together process each file exactly once.
+    Files are assigned to shards either by a stable hash of the path or by balancing total file size.
+    '''
+
+    __slots__ = ["__index", "__count", "__is_size_balanced"]
+
+    def __init__(self, index, count, is_size_balanced=False):
+        if count < 1:
+            raise AppException("Shard count minimum is 1")
+        if index < 1 or index > count:
+            raise AppException(f"Shard index must be 1 to {count}")
+        self.__index = index
+        self.__count = count
+        self.__is_size_balanced = bool(is_size_balanced)
+
+    @staticmethod
+    def parse(spec, is_size_balanced=False):
+        '''Creates a shard from text formatted as INDEX/COUNT; index is 1-based'''
+        match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", spec)
+        if not match:
+            raise AppException(f"Shard must be formatted as INDEX/COUNT such as 1/4; not '{spec}'")
+        return FileShard(int(match.group(1)), int(match.group(2)), is_size_balanced)
+
+    @property
+    def index(self):
+        '''1-based index of the shard'''
+        return self.__index
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def is_size_balanced(self):
+        '''Whether files are assigned to balance total file size instead of by path hash'''
+        return self.__is_size_balanced
+
+    def select(self, file_paths):
+        '''Returns the file paths of this shard; in the order given'''
+        if self.__count == 1:
+            return list(file_paths)
+        if self.__is_size_balanced:
+            selected = self.__get_size_balanced_paths(file_paths)
+            return [path for path in file_paths if path in selected]
+        return [path for path in file_paths if self.__get_path_hash(path) % self.__count == self.__index - 1]
+
+    def __get_path_hash(self, path):
+        # normalized so that the same relative path hashes the same on each platform
+        return zlib.crc32(os.path.normpath(path).replace(os.sep, "/").encode("utf-8"))
+
+    def __get_size_balanced_paths(self, file_paths):
+        '''Assigns files, largest first, to the shard with the least total size; returns the paths of this shard'''
+        sized_paths = sorted(((os.path.getsize(path), os.path.normpath(path).replace(os.sep, "/"), path) for path in file_paths),
+                             key=lambda item: (-item[0], item[1]))
+        bins = [(0, index) for index in range(self.__count)]
+        selected = set()
+        for size, _, path in sized_paths:
+            total, index = heapq.heappop(bins)
+            if index == self.__index - 1:
+                selected.add(path)
+            heapq.heappush(bins, (total + size, index))
+        return selected
+
+    def __str__(self):
+        return f"{self.__index}/{self.__count}"
+
+class FileClassifier(object):
+    '''
+    Classifies files as text or binary with as little I/O as possible.
+    A file with a binary extension is classified without opening it. Otherwise, the start of the
+    file is read once as raw bytes and checked for a known binary signature (magic number) and for
+    NUL bytes before it is decoded to detect the text encoding.
+    A file with a text extension skips the signature check.
+    '''
+
+    __slots__ = ["__text_extensions", "__binary_extensions", "__counts"]
+
+    TEXT_BY_EXTENSION = "text by extension"
+    TEXT_BY_CONTENT = "text by content"
+    BINARY_BY_EXTENSION = "binary by extension"
+    BINARY_BY_CONTENT = "binary by content"
+    UNSUPPORTED_ENCODING = "unsupported encoding"
+
+    DEFAULT_TEXT_EXTENSIONS = [
+        ".txt", ".md", ".rst", ".json", ".xml", ".html", ".htm", ".css", ".scss", ".yml", ".yaml", ".toml",
+        ".ini", ".cfg", ".sh", ".bat", ".cmd", ".ps1", ".java", ".kt", ".rs", ".rb", ".pl", ".php", ".sql",
+        ".cmake", ".mk", ".swift", ".m", ".mm", ".vb", ".fs", ".lua", ".r", ".scala", ".vue",
+    ] + [extension for extensions in _CODE_LANGUAGE_EXTENSIONS.values() for extension in extensions]
+
+    DEFAULT_BINARY_EXTENSIONS = [
+        ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".webp", ".tif", ".tiff", ".psd",
+        ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".jar", ".war", ".ear", ".whl", ".nupkg",
+        ".o", ".obj", ".a", ".lib", ".so", ".dll", ".dylib", ".exe", ".pdb", ".class", ".pyc", ".pyo",
+        ".pdf", ".mp3", ".mp4", ".wav", ".avi", ".mov", ".ttf", ".otf", ".woff", ".woff2", ".eot",
+        ".iso", ".dmg", ".sqlite",
+    ]
+
+    BINARY_SIGNATURES = (
+        b"\x89PNG", b"\xff\xd8\xff", b"GIF87a", b"GIF89a", b"PK\x03\x04", b"PK\x05\x06", b"\x1f\x8b",
+        b"BZh", b"\xfd7zXZ\x00", b"7z\xbc\xaf\x27\x1c", b"Rar!\x1a\x07", b"%PDF-", b"\x7fELF",
+        b"\xca\xfe\xba\xbe", b"\xfe\xed\xfa\xce", b"\xfe\xed\xfa\xcf", b"\xce\xfa\xed\xfe", b"\xcf\xfa\xed\xfe",
+        b"\x00asm", b"SQLite format 3\x00", b"MZ\x90\x00",
+    )
+
+    UTF16_BOMS = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+    # enough raw bytes to decode the 512 chars that encoding detection has always checked
+    HEAD_SIZE = 8192
+
+    def __init__(self):
+        self.__text_extensions = set(self.DEFAULT_TEXT_EXTENSIONS)
+        self.__binary_extensions = set(self.DEFAULT_BINARY_EXTENSIONS)
+        self.__counts = collections.Counter()
+
+    @property
+    def counts(self):
+        '''Number of files by classification'''
+        return self.__counts
+
+    def __normalize_extension(self, extension):
+        extension = extension.lower()
+        return extension if extension.startswith(".") else "." + extension
+
+    def add_text_extension(self, extension):
+        '''Classifies files with the extension as text without checking for a binary signature'''
+        extension = self.__normalize_extension(extension)
+        self.__binary_extensions.discard(extension)
+        self.__text_extensions.add(extension)
+
+    def add_binary_extension(self, extension):
+        '''Classifies files with the extension as binary without opening them'''
+        extension = self.__normalize_extension(extension)
+        self.__text_extensions.discard(extension)
+        self.__binary_extensions.add(extension)
+
+    def classify(self, file_path):
+        '''
+        Returns the classification of a file and its text encoding; None for binary or unsupported encoding
+        '''
+        if os.path.splitext(file_path)[1].lower() in self.__binary_extensions:
+            return self.__count(self.BINARY_BY_EXTENSION), None
+        with open(file_path, "rb") as f:
+            head = f.read(self.HEAD_SIZE)
+        return self.classify_head(file_path, head)
+
+    def classify_head(self, name, head):
+        '''
+        Returns the classification of content by its name and start (HEAD_SIZE bytes) and its text encoding;
+        for content that is not in a file such as an archive member
+        '''
+        extension = os.path.splitext(name)[1].lower()
+        if extension in self.__binary_extensions:
+            return self.__count(self.BINARY_BY_EXTENSION), None
+        is_text_extension = extension in self.__text_extensions
+        if not is_text_extension and self.is_binary_content(head):
+            return self.__count(self.BINARY_BY_CONTENT), None
+        encoding = self.detect_encoding(head)
+        if not encoding:
+            return self.__count(self.UNSUPPORTED_ENCODING), None
+        return self.__count(self.TEXT_BY_EXTENSION if is_text_extension else self.TEXT_BY_CONTENT), encoding
+
+    def __count(self, classification):
+        self.__counts[classification] += 1
+        return classification
+
+    @classmethod
+    def is_binary_content(cls, head):
+        '''Whether the start of a file has a binary signature or (unless UTF-16) a NUL byte'''
+        if head.startswith(cls.BINARY_SIGNATURES):
+            return True
+        return not head.startswith(cls.UTF16_BOMS) and b"\x00" in head
+
+    @classmethod
+    def detect_encoding(cls, head):
+        '''
+        Returns the supported encoding that decodes the start of a file or None.
+        UTF-16 requires a byte order mark.
+        '''
+        encoding = "utf-16" if head.startswith(cls.UTF16_BOMS) else "utf-8"
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(head)
+            return encoding
+        except UnicodeDecodeError:
+            return None
+
     def __str__(self):
-        return f"{{match_patterns:{self.match_patterns} depth_limit:{self.depth_limit}}}"
+        return ", ".join(f"{count} {classification}" for classification, count in self.__counts.items())
+
+class ContentGuard(object):
+    '''
+    Detects files that are pathological to conform -- too large, with extremely long lines, minified
+    or generated -- so that they can be skipped or conformed with a cheap operation instead of stalling
+    a run. Each check is disabled by default. Detection scans the content at C speed; without
+    splitting it into lines.
+    '''
+
+    __slots__ = ["__max_file_size", "__max_line_length", "__detect_generated"]
+
+    # average line length above which content is considered minified
+    MINIFIED_AVERAGE_LINE_LENGTH = 300
+    # content shorter than this is never considered minified
+    MINIFIED_MIN_SIZE = 1024
+    MINIFIED_NAME_REGEX = re.compile(r".*\.min\.(?:js|mjs|css)$", re.IGNORECASE)
+    # markers of generated code; i.e. Go's "Code generated ... DO NOT EDIT." and C#'s <auto-generated>
+    GENERATED_MARKER_REGEX = re.compile(r"@generated\b|\bDO NOT EDIT\b|<auto-generated")
+    # number of chars at the start of the content searched for a generated marker
+    GENERATED_MARKER_HEAD_SIZE = 2048
+    # max_line_length when there is a time budget but no max line length since a single line is not interrupted
+    BUDGET_MAX_LINE_LENGTH = 1 << 20
+
+    def __init__(self):
+        self.__max_file_size = None
+        self.__max_line_length = None
+        self.__detect_generated = False
+
+    @property
+    def max_file_size(self):
+        '''Files larger than this number of bytes are guarded; None for no limit'''
+        return self.__max_file_size
+    @max_file_size.setter
+    def max_file_size(self, to):
+        if to is not None and to < 1:
+            raise AppException("Max file size minimum is 1")
+        self.__max_file_size = to
+
+    @property
+    def max_line_length(self):
+        '''Files with a line longer than this number of chars are guarded; None for no limit'''
+        return self.__max_line_length
+    @max_line_length.setter
+    def max_line_length(self, to):
+        if to is not None and to < 1:
+            raise AppException("Max line length minimum is 1")
+        self.__max_line_length = to
+
+    @property
+    def detect_generated(self):
+        '''Whether minified and generated files are guarded'''
+        return self.__detect_generated
+    @detect_generated.setter
+    def detect_generated(self, to):
+        self.__detect_generated = bool(to)
+
+    @property
+    def is_enabled(self):
+        return self.__max_file_size is not None or self.__max_line_length is not None or self.__detect_generated
+
+    def check_file(self, file_path):
+        '''Returns the reason a file is guarded by its size or name or None if not guarded; without reading it'''
+        return self.check_size_and_name(os.path.getsize(file_path) if self.__max_file_size is not None else 0, file_path)
+
+    def check_size_and_name(self, size, name):
+        '''Returns the reason content is guarded by its size (in bytes) or file name or None if not guarded'''
+        if self.__max_file_size is not None and size > self.__max_file_size:
+            return f"file size {size} exceeds {self.__max_file_size}"
+        if self.__detect_generated and self.MINIFIED_NAME_REGEX.match(os.path.basename(name)):
+            return "minified by name"
+        return None
+
+    def check_text(self, text):
+        '''Returns the reason content is guarded or None if not guarded'''
+        if self.__max_line_length is not None:
+            line_length = self.find_line_longer_than(text, self.__max_line_length)
+            if line_length is not None:
+                return f"line length {line_length} exceeds {self.__max_line_length}"
+        if self.__detect_generated:
+            if len(text) >= self.MINIFIED_MIN_SIZE and len(text) / (text.count("\n") + 1) > self.MINIFIED_AVERAGE_LINE_LENGTH:
+                return "minified by average line length"
+            match = self.GENERATED_MARKER_REGEX.search(text, 0, self.GENERATED_MARKER_HEAD_SIZE)
+            if match:
+                return f"generated by marker '{match.group()}'"
+        return None
+
+    @staticmethod
+    def find_line_longer_than(text, max_length):
+        '''Returns the length of the first line of text longer than max_length chars or None if none'''
+        if len(text) <= max_length:
+            return None
+        # jump to the last newline within max_length + 1 chars of each line start so that
+        # the text is searched a window at a time instead of a line at a time
+        line_start = 0
+        while len(text) - line_start > max_length:
+            newline_index = text.rfind("\n", line_start, line_start + max_length + 1)
+            if newline_index == -1:
+                line_end = text.find("\n", line_start)
+                return (len(text) if line_end == -1 else line_end) - line_start
+            line_start = newline_index + 1
+        return None
 
 class FileProcessor(object):
-    __slots__ = "__logger"
+    __slots__ = "__logger", "__classifier"
 
-    def __init__(self, logger):
+    def __init__(self, logger, classifier=None):
         self.__logger = logger
+        self.__classifier = FileClassifier() if classifier is None else classifier
 
-    def __find_files_in_tree(self, selected_files_by_path, dir_path, file_select, depth):
+    @property
+    def classifier(self):
+        '''Classifies found files as text or binary'''
+        return self.__classifier
+
+    def __find_files_in_tree(self, is_specified_by_path, dir_path, file_select, depth):
         '''
         Finds files in a directory tree based on selection criteria
 
         ### Parameters
-        selected_files_by_path (dict): Selected files by path
+        is_specified_by_path (dict): Whether specified via path (else matched) by path of each file found
         dir_path (string): Directory path
         file_select (FileSelect): Selection criteria
         depth (number): Current depth of search
@@ -336,17 +1989,13 @@ class FileProcessor(object):
                 sub_pattern = os.path.join(dir_path, match_pattern)
                 matching_sub_paths = glob.glob(sub_pattern)
                 for sub_path in matching_sub_paths:
-                    encoding = self.detect_encoding_or_none(sub_path)
                     if os.path.isfile(sub_path):
-                        if not encoding:
-                            self.__logger.log(f"{sub_path}: ignoring file since is unsupported text encoding or binary")
-                        else:
-                            selected_files_by_path[sub_path] = encoding
+                        is_specified_by_path.setdefault(sub_path, False)
             # search sub-dirs
             sub_paths = glob.glob(os.path.join(dir_path, "*"))
             for sub_path in sub_paths:
                 if os.path.isdir(sub_path):
-                    self.__find_files_in_tree(selected_files_by_path, sub_path, file_select, depth + 1)
+                    self.__find_files_in_tree(is_specified_by_path, sub_path, file_select, depth + 1)
 
     def find_files(self, path_specs, file_select=FileSelect()):
         '''
@@ -355,22 +2004,34 @@ class FileProcessor(object):
         ### Parameters
         path_specs (string[]): Path patterns to select files and directories; can contain path wildcards
         file_select (FileSelect): Selection criteria
+
+        ### Returns
+        dict: Encoding by path of each selected file
         '''
-        selected_files_by_path = dict()
+        is_specified_by_path = dict()
         for path_spec in path_specs:
             paths = glob.glob(path_spec)
             if len(paths) == 0:
                 raise AppException(f"No files selected by '{path_spec}'")
             for path in paths:
                 if os.path.isfile(path):
-                    encoding = self.detect_encoding_or_none(path)
-                    if not encoding:
-                        raise AppException(f"File is unsupported text encoding or binary '{path}'")
-                    selected_files_by_path[path] = encoding
+                    is_specified_by_path[path] = True
                 elif os.path.isdir(path):
-                    self.__find_files_in_tree(selected_files_by_path, path, file_select, 0)
+                    self.__find_files_in_tree(is_specified_by_path, path, file_select, 0)
                 else:
                     raise RuntimeError(f"INTERNAL ERROR: Path is neither file nor dir: {path}")
+        file_paths = list(is_specified_by_path)
+        if file_select.shard:
+            file_paths = file_select.shard.select(file_paths)
+        selected_files_by_path = dict()
+        for path in file_paths:
+            _, encoding = self.__classifier.classify(path)
+            if encoding:
+                selected_files_by_path[path] = encoding
+            elif is_specified_by_path[path]:
+                raise AppException(f"File is unsupported text encoding or binary '{path}'")
+            else:
+                self.__logger.log(f"{path}: ignoring file since is unsupported text encoding or binary")
         return selected_files_by_path
 
     def detect_encoding_or_none(self, file_path):
@@ -378,29 +2039,182 @@ class FileProcessor(object):
         Returns the first supported encoding that works for the file or None if none work which 
         means the file is either unsupported text encoding or binary.
         '''
-        encodings = ["utf-16", "utf-8"]
-        for encoding in encodings:
-            try:
-                with open(file_path, encoding=encoding) as f:
-                    f.read(512)
-                return encoding
-            except:
-                pass
-        return None
+        with open(file_path, "rb") as f:
+            return FileClassifier.detect_encoding(f.read(FileClassifier.HEAD_SIZE))
     
+class ArchiveConformer(object):
+    '''
+    Conforms the text members of a zip or tar (optionally compressed) archive in memory in a single
+    sequential pass; without extracting to disk or temp files. Each member is classified like a file
+    and a binary member, unsupported member or member that fails is copied as-is. Writes a conformed
+    archive of the same kind or, with no output, only checks (reports) the members.
+
+    ### Parameters
+    logger (Logger): Logs results
+    classifier (FileClassifier): Classifies members as text or binary
+    file_conformer (FileConformer): Conforms the content of a member
+    line_conformer (LineConformer): Provides the operations of a profile
+    content_guard (ContentGuard): Guards pathological members
+    guard_action (string): For a guarded member, "skip" to copy it as-is or "trim" to only trim trailing whitespace
+    '''
+
+    __slots__ = ["__logger", "__classifier", "__file_conformer", "__line_conformer", "__content_guard", "__guard_action",
+                 "__member_count", "__change_count", "__error_count", "__skip_count"]
+
+    # tar compression by output file name suffix; in order of precedence
+    TAR_COMPRESSIONS = [(".tar.gz", "gz"), (".tgz", "gz"), (".tar.bz2", "bz2"), (".tbz2", "bz2"), (".tar.xz", "xz"), (".txz", "xz")]
+
+    def __init__(self, logger, classifier, file_conformer, line_conformer, content_guard, guard_action="skip"):
+        self.__logger = logger
+        self.__classifier = classifier
+        self.__file_conformer = file_conformer
+        self.__line_conformer = line_conformer
+        self.__content_guard = content_guard
+        self.__guard_action = guard_action
+        self.__member_count = 0
+        self.__change_count = 0
+        self.__error_count = 0
+        self.__skip_count = 0
+
+    @property
+    def member_count(self):
+        '''Number of text members processed'''
+        return self.__member_count
+
+    @property
+    def change_count(self):
+        '''Number of text members with changes'''
+        return self.__change_count
+
+    @property
+    def error_count(self):
+        return self.__error_count
+
+    @property
+    def skip_count(self):
+        '''Number of text members skipped by the content guard'''
+        return self.__skip_count
+
+    def conform(self, archive_path, profile, output_path=None):
+        '''
+        Conforms the text members of an archive; fails for an archive that cannot be read (i.e. corrupt or
+        truncated) and then deletes the partial output
+
+        ### Parameters
+        archive_path (string): Path of a zip or tar archive; tar can be compressed (gz, bz2 or xz)
+        profile (OperationProfile): Operations to apply to each text member
+        output_path (string|None): Path to write the conformed archive to or None to only check
+        '''
+        if not os.path.isfile(archive_path):
+            raise AppException(f"Archive not found: {archive_path}")
+        if output_path and os.path.abspath(output_path) == os.path.abspath(archive_path):
+            raise AppException(f"Archive output must not be the archive: {output_path}")
+        try:
+            if zipfile.is_zipfile(archive_path):
+                self.__conform_zip(archive_path, profile, output_path)
+            else:
+                self.__conform_tar(archive_path, profile, output_path)
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError, zlib.error, OSError) as e:
+            raise AppException(f"{archive_path}: failed to process archive; {e}")
+
+    def __discard_output(self, archive_out, output_path):
+        '''Closes and deletes a partially written output archive since it would look valid'''
+        try:
+            archive_out.close()
+        finally:
+            os.remove(output_path)
+
+    def __conform_zip(self, archive_path, profile, output_path):
+        with zipfile.ZipFile(archive_path) as zip_in:
+            zip_out = zipfile.ZipFile(output_path, "w") if output_path else None
+            try:
+                for info in zip_in.infolist():
+                    data = zip_in.read(info)
+                    if not info.is_dir():
+                        data = self.__conform_member(archive_path, info.filename, data, profile, zip_out is not None)
+                    if zip_out:
+                        # copy so that writing does not alter the sizes and CRC of the input member info
+                        zip_out.writestr(copy.copy(info), data)
+            except BaseException:
+                if zip_out:
+                    self.__discard_output(zip_out, output_path)
+                raise
+            if zip_out:
+                zip_out.close()
+
+    def __conform_tar(self, archive_path, profile, output_path):
+        try:
+            # stream modes (|) read and write strictly sequentially
+            tar_in = tarfile.open(archive_path, "r|*")
+        except tarfile.TarError:
+            raise AppException(f"{archive_path}: not a zip or tar archive")
+        with tar_in:
+            tar_out = tarfile.open(output_path, f"w|{self.__get_tar_compression(output_path)}") if output_path else None
+            try:
+                for member in tar_in:
+                    if not member.isfile():
+                        if tar_out:
+                            tar_out.addfile(member)
+                        continue
+                    data = tar_in.extractfile(member).read()
+                    data = self.__conform_member(archive_path, member.name, data, profile, tar_out is not None)
+                    if tar_out:
+                        out_member = copy.copy(member)
+                        out_member.size = len(data)
+                        tar_out.addfile(out_member, io.BytesIO(data))
+            except BaseException:
+                if tar_out:
+                    self.__discard_output(tar_out, output_path)
+                raise
+            if tar_out:
+                tar_out.close()
+
+    def __get_tar_compression(self, output_path):
+        name = output_path.lower()
+        return next((compression for suffix, compression in self.TAR_COMPRESSIONS if name.endswith(suffix)), "")
+
+    def __conform_member(self, archive_path, name, data, profile, is_writing):
+        '''Returns the conformed data of a member or data if it is not a text member, has no changes or fails'''
+        path = f"{archive_path}!{name}"
+        classification, encoding = self.__classifier.classify_head(name, data[:FileClassifier.HEAD_SIZE])
+        if not encoding:
+            self.__logger.log_verbose("{}: ignoring member since {}", path, classification)
+            return data
+        self.__member_count += 1
+        try:
+            file_conformer = self.__file_conformer
+            file_conformer.load_from_bytes(data, encoding, path)
+            if self.__content_guard.is_enabled:
+                guard_reason = self.__content_guard.check_size_and_name(len(data), name) or \
+                    self.__content_guard.check_text(file_conformer.text)
+                if guard_reason and self.__guard_action == "skip":
+                    self.__skip_count += 1
+                    self.__logger.log(f"{path}: skipped; {guard_reason}")
+                    self.__logger.report_record("skipped", path=path, reason=guard_reason)
+                    return data
+                if guard_reason:
+                    self.__logger.log_verbose("{}: {}; trimming only", path, guard_reason)
+                    profile = OperationProfile("none", profile.tab_size, False)
+            self.__line_conformer.start_file(name)
+            change_count = file_conformer.conform_lines(self.__line_conformer.get_operations(profile))
+            is_modified = file_conformer.is_modified
+            if is_modified:
+                self.__change_count += 1
+                self.__logger.log(f"{path}: {'updated' if is_writing else f'changes: {change_count}'}")
+            else:
+                self.__logger.log(f"{path}: no changes")
+            self.__logger.report_record("file", path=path, encoding=encoding, changes=change_count,
+                                        modified=is_modified, updated=is_modified and is_writing, cached=False)
+            return file_conformer.get_bytes() if is_modified else data
+        except Exception as e:
+            self.__error_count += 1
+            self.__logger.log(f"{path}: ERROR {e}")
+            self.__logger.report_record("error", path=path, message=str(e))
+            return data
+
 if __name__ == '__main__':
-    supported_operation_infos = [
-        ("none", "Use to _only_ remove trailing whitespace"),
-        ("detab-leading", "Replace tabs with spaces before the first non-whitespace character"),
-        ("detab-text", "Replace tabs with spaces throughout; no special handing for string literals"),
-        ("detab-code", "Replace tabs with spaces throughout; replace tabs in string literals with \\t"),
-        ("entab-leading", "Replace spaces with tabs before the first non-whitespace character"),
-       #("entab-text" "Replace spaces with tabls throughout; no special handing for string literals"),
-       #("entab-code" "FUTURE: Replace spaces with tabs throughout while ignoring string literals"),
-    ]
-    supported_operations = [i[0] for i in supported_operation_infos]
-    op_field_width = len(max(supported_operations, key=len)) + 2
-    tab_operations_help = "".join([f'\n  {i[0]:{op_field_width}}{i[1]}' for i in supported_operation_infos])
+    op_field_width = len(max(TAB_OPERATIONS, key=len)) + 2
+    tab_operations_help = "".join([f'\n  {i[0]:{op_field_width}}{i[1]}' for i in TAB_OPERATION_INFOS])
     script_name = os.path.splitext(os.path.basename(os.path.abspath(__file__)))[0]
     epilog = f"""
 tab operations:{tab_operations_help}
@@ -444,7 +2258,50 @@ examples:
   > {script_name} a.c --tab-operation entab-leading
 
   Replace leading spaces with tabs and trim whitespace from the end of each line.
+
+  > {script_name} --update src
+
+  With src/.better-space containing the lines:
+    [Makefile]
+    tab-operation = entab-leading
+  replace leading spaces with tabs in each Makefile and leading tabs with spaces in other files.
+
+  > {script_name} --update --lines 10-20 --lines 42 a.c
+
+  Conform only lines 10 to 20 and line 42 of a.c; i.e. the lines just edited.
+
+  > {script_name} --update --git-changed src
+
+  Conform only the lines of files in src that are changed relative to git HEAD.
+
+  > {script_name} --archive-output clean.tar.gz bundle.tar.gz
+
+  Write clean.tar.gz with the text members of bundle.tar.gz conformed; without extracting it.
+
+  > {script_name} --audit src
+
+  Report indentation style, trailing whitespace and which tab operations would change each file
+  in src and for all files; without changing files.
+
+  > {script_name} --guard-generated --max-line-length 2000 --time-budget 10 src
+
+  Skip minified and generated files and files with a line longer than 2000 chars and abort any
+  file that takes longer than 10 seconds.
+
+  > {script_name} --update --journal progress.ndjson --resume src
+
+  Conform the files of src except those completed by a previous run (with the same journal) that
+  was stopped before it finished.
+
+  > {script_name} --shard 2/4 --report shard2.ndjson src
+  > {script_name} --merge-reports all.ndjson shard1.ndjson shard2.ndjson shard3.ndjson shard4.ndjson
+
+  Process the second of four shares of the files in src; i.e. on the second of four CI machines.
+  Then, combine the reports of the four runs into one.
   """
+    logger = Logger()
+    journal = None
+    run_profiler = None
     try:
         parser = argparse.ArgumentParser(
             #formatter_class=argparse.RawTextHelpFormatter,
@@ -457,59 +2314,223 @@ examples:
                             help="save modified files; not saved by default")
         parser.add_argument("-v", "--verbose", action="store_true", 
                             help="verbose logging")
-        parser.add_argument("--leave-trailing", action="store_true", 
+        parser.add_argument("--leave-trailing", action="store_true", default=None,
                             help="leave any trailing whitespace; default is to trim")
-        parser.add_argument("-o", "--tab-operation", metavar="OPERATION", default="detab-leading",
-                            help=f"detab/entab operation; default: detab-leading; supported: {', '.join(supported_operations)}")
-        parser.add_argument("-s", "--tab-size", type=int, metavar="SIZE", default=4,
-                            help="number of spaces for a tab")
+        parser.add_argument("-o", "--tab-operation", metavar="OPERATION",
+                            help=f"detab/entab operation; default: detab-leading; supported: {', '.join(TAB_OPERATIONS)}")
+        parser.add_argument("-s", "--tab-size", type=int, metavar="SIZE",
+                            help="number of spaces for a tab; default: 4")
+        parser.add_argument("--no-config", action="store_true",
+                            help=f"ignore {ConfigResolver.FILE_NAME} config files")
         parser.add_argument("-m", "--match", metavar="PATTERN", action='append',
                             help="pattern to match files in a directory; default is all files")
         parser.add_argument("-d", "--depth-limit", type=int, metavar="LIMIT",
                             help="limit to directory level searching; default is unlimited")
+        parser.add_argument("--report", metavar="PATH",
+                            help="write a report of each file and change as newline-delimited JSON (NDJSON)")
+        line_select_group = parser.add_mutually_exclusive_group()
+        line_select_group.add_argument("--lines", metavar="START-END", action="append",
+                            help="conform only lines START to END (1-based, inclusive); can be repeated; i.e. for an editor on-save")
+        line_select_group.add_argument("--git-changed", action="store_true",
+                            help="conform only lines changed in the working tree relative to git HEAD; all lines of untracked files")
+        parser.add_argument("--audit", action="store_true",
+                            help="report whitespace statistics and which operations would change each file; without changing files")
+        parser.add_argument("--text-ext", metavar="EXT", action="append", default=[],
+                            help="treat files with extension EXT as text; without checking for binary content")
+        parser.add_argument("--binary-ext", metavar="EXT", action="append", default=[],
+                            help="treat files with extension EXT as binary; without opening them")
+        parser.add_argument("--shard", metavar="INDEX/COUNT",
+                            help="process only a deterministic share of the selected files such as 1/4; for distributing a run across machines")
+        parser.add_argument("--shard-by", choices=["hash", "size"], default="hash",
+                            help="assign files to shards by path hash or to balance total file size; default: hash")
+        parser.add_argument("--cache-dir", metavar="DIR",
+                            help="cache results by file content in DIR so that identical content is processed once; can be shared by runs on the same machine")
+        parser.add_argument("--max-file-size", type=int, metavar="BYTES",
+                            help="guard files larger than BYTES; default is no limit")
+        parser.add_argument("--max-line-length", type=int, metavar="LENGTH",
+                            help="guard files with a line longer than LENGTH chars; default is no limit")
+        parser.add_argument("--guard-generated", action="store_true",
+                            help="guard minified files (by name or average line length) and generated files (by marker such as DO NOT EDIT)")
+        parser.add_argument("--guard-action", choices=["skip", "trim"], default="skip",
+                            help="for a guarded file, skip it or only trim trailing whitespace; default: skip")
+        parser.add_argument("--time-budget", type=float, metavar="SECONDS",
+                            help="abort conforming a file that takes longer than SECONDS and report it as failed; also guards "
+                                 f"lines longer than {ContentGuard.BUDGET_MAX_LINE_LENGTH} chars unless --max-line-length; default is no limit")
+        parser.add_argument("--archive", action="store_true",
+                            help="treat each path as a zip or tar (.tar, .tar.gz, .tgz, .tar.bz2, .tar.xz) archive and check its text members in memory")
+        parser.add_argument("--archive-output", metavar="OUTPUT",
+                            help="with an archive path, write the archive with conformed text members to OUTPUT; implies --archive")
+        parser.add_argument("--journal", metavar="PATH",
+                            help="with --update, record each completed file in journal PATH so that a stopped run can be resumed")
+        parser.add_argument("--resume", action="store_true",
+                            help="skip the files recorded in the journal (--journal) that have not changed since; to continue a stopped run")
+        parser.add_argument("--profile", metavar="PATH",
+                            help="profile the run with cProfile and write the stats to PATH (pstats format)")
+        parser.add_argument("--trace-memory", action="store_true",
+                            help="trace memory allocations and report the peak and the top allocation sites of FileConformer and LineConformer")
+        parser.add_argument("--merge-reports", metavar="OUTPUT",
+                            help="combine the reports (--report) specified via path into report OUTPUT instead of processing files")
 
         args = parser.parse_args()
 
-        logger = Logger()
         logger.is_verbose_enabled = args.verbose
+        if args.report:
+            logger.report = ReportWriter(args.report)
+        if args.profile or args.trace_memory:
+            run_profiler = RunProfiler(logger, args.profile, [FileConformer, LineConformer] if args.trace_memory else [])
+            run_profiler.start()
+        if args.merge_reports:
+            summary = ReportMerger(logger).merge(args.path, args.merge_reports)
+            message = f"Files processed: {summary['processed']}; with changes: {summary['changed']}"
+            if summary["failed"] > 0:
+                message += f" failed: {summary['failed']}"
+            logger.log(message)
+            sys.exit(0)
 
+        overrides = {"tab-operation": args.tab_operation, "tab-size": args.tab_size, "leave-trailing": args.leave_trailing}
+        overrides = {name: value for name, value in overrides.items() if value is not None}
+        default_profile = OperationProfile(**{name.replace("-", "_"): value for name, value in overrides.items()})
+        config_resolver = None if args.no_config else ConfigResolver(default_profile, overrides)
         line_conformer = LineConformer()
-        operations = []
-        if not args.leave_trailing:
-            operations.append(line_conformer.trim_trailing)
-        if not args.tab_operation in supported_operations:
-            exit(f"Unknown operation '{args.tab_operation}', supported operations: {', '.join(supported_operations)}")
-        if args.tab_operation == "none":
-            pass
-        elif args.tab_operation == "detab-leading":
-            operations.append(lambda line, log: line_conformer.detab_leading(line, log, args.tab_size))
-        elif args.tab_operation == "detab-text":
-            operations.append(lambda line, log: line_conformer.detab_line(line, log, args.tab_size))
-        elif args.tab_operation == "detab-code":
-            operations.append(lambda line, log: line_conformer.detab_code_line(line, log, args.tab_size))
-        elif args.tab_operation == "entab-leading":
-            operations.append(lambda line, log: line_conformer.entab_leading(line, log, args.tab_size))
-        elif args.tab_operation == "entab-text":
-            operations.append(lambda line, log: line_conformer.entab_line(line, log, args.tab_size))
-        else:
-            exit(f"Operation '{args.tab_operation}' is not supported")
+        content_guard = ContentGuard()
+        content_guard.max_file_size = args.max_file_size
+        content_guard.max_line_length = args.max_line_length
+        if args.time_budget and not args.max_line_length:
+            content_guard.max_line_length = ContentGuard.BUDGET_MAX_LINE_LENGTH
+        content_guard.detect_generated = args.guard_generated
+        file_processor = FileProcessor(logger)
+        for extension in args.text_ext:
+            file_processor.classifier.add_text_extension(extension)
+        for extension in args.binary_ext:
+            file_processor.classifier.add_binary_extension(extension)
+
+        if args.archive or args.archive_output:
+            if args.update:
+                raise AppException("--update is not supported for archives; use --archive-output")
+            if args.archive_output and len(args.path) != 1:
+                raise AppException("--archive-output requires exactly one archive path")
+            file_conformer = FileConformer(logger)
+            file_conformer.time_budget = args.time_budget
+            archive_conformer = ArchiveConformer(logger, file_processor.classifier, file_conformer, line_conformer,
+                                                 content_guard, args.guard_action)
+            for archive_path in args.path:
+                archive_conformer.conform(archive_path, default_profile, args.archive_output)
+            message = f"\nMembers processed: {archive_conformer.member_count}; with changes: {archive_conformer.change_count}"
+            if archive_conformer.error_count > 0:
+                message += f" failed: {archive_conformer.error_count}"
+            if archive_conformer.skip_count > 0:
+                message += f" skipped: {archive_conformer.skip_count}"
+            logger.log(message)
+            logger.log(f"Members classified: {file_processor.classifier}")
+            if args.archive_output:
+                logger.log(f"Archive written: {args.archive_output}")
+            elif archive_conformer.change_count > 0:
+                logger.log(f"Hint: Include --archive-output to write a conformed archive")
+            logger.report_record("summary", processed=archive_conformer.member_count, changed=archive_conformer.change_count,
+                                 failed=archive_conformer.error_count, skipped=archive_conformer.skip_count,
+                                 classified=dict(file_processor.classifier.counts))
+            sys.exit(0)
 
         file_select = FileSelect()
         if args.match != None:
             file_select.match_patterns = args.match
         if args.depth_limit != None:
             file_select.depth_limit = args.depth_limit
-        file_processor = FileProcessor(logger)
+        if args.shard != None:
+            file_select.shard = FileShard.parse(args.shard, args.shard_by == "size")
         selected_files_by_path = file_processor.find_files(args.path, file_select)
 
+        if args.audit:
+            auditor = WhitespaceAuditor()
+            file_conformer = FileConformer(logger)
+            for file_path,encoding in selected_files_by_path.items():
+                try:
+                    stats = auditor.audit_file(file_conformer, file_path, encoding)
+                    logger.log(f"{file_path}: {auditor.format_stats(stats)}")
+                    logger.report_record("audit", path=file_path, encoding=encoding, **stats)
+                except Exception as e:
+                    logger.log(f"{file_path}: ERROR {e}")
+                    logger.report_record("error", path=file_path, message=str(e))
+            logger.log("\n" + auditor.format_totals())
+            logger.report_record("audit-summary", files=auditor.file_count, **auditor.totals)
+            sys.exit(0)
+
+        if args.resume and not args.journal:
+            raise AppException("--resume requires --journal")
+        if args.journal and not args.update:
+            raise AppException("--journal requires --update")
+        result_cache = ResultCache(args.cache_dir) if args.cache_dir else None
+        line_ranges = [FileConformer.parse_line_range(spec) for spec in args.lines] if args.lines else None
+        git_changes = GitChanges() if args.git_changed else None
+
+        if args.journal:
+            journal_options = f"{default_profile} config:{not args.no_config} lines:{line_ranges} git_changed:{args.git_changed}"
+            journal = ProgressJournal(args.journal, journal_options, args.resume)
+
         file_change_count = 0
         file_error_count = 0
+        file_skip_count = 0
         file_conformer = FileConformer(logger)
+        file_conformer.time_budget = args.time_budget
         for file_path,encoding in selected_files_by_path.items():
             try:
-                file_conformer.load_from_file(file_path, encoding)
-                change_count = file_conformer.conform_lines(operations)
-                if file_conformer.is_modified:
+                if journal and journal.is_done(file_path):
+                    logger.log_verbose("{}: done in previous run", file_path)
+                    continue
+                file_line_ranges = line_ranges
+                if git_changes:
+                    file_line_ranges = git_changes.get_line_ranges(file_path)
+                    if file_line_ranges == []:
+                        logger.log(f"{file_path}: no changed lines")
+                        logger.report_record("file", path=file_path, encoding=encoding, changes=0,
+                                             modified=False, updated=False, cached=False)
+                        if journal:
+                            # written before the file is recorded so that a killed run does not lose its result
+                            logger.flush()
+                            journal.record(file_path)
+                        continue
+                profile = config_resolver.get_profile(file_path) if config_resolver else default_profile
+                if profile is not default_profile:
+                    logger.log_verbose("{}: profile: {}", file_path, profile)
+                guard_reason = content_guard.check_file(file_path) if content_guard.is_enabled else None
+                if guard_reason is None or args.guard_action != "skip":
+                    file_conformer.load_from_file(file_path, encoding, result_cache is not None)
+                    if guard_reason is None and content_guard.is_enabled:
+                        guard_reason = content_guard.check_text(file_conformer.text)
+                if guard_reason:
+                    if args.guard_action == "skip":
+                        file_skip_count += 1
+                        logger.log(f"{file_path}: skipped; {guard_reason}")
+                        logger.report_record("skipped", path=file_path, reason=guard_reason)
+                        continue
+                    logger.log_verbose("{}: {}; trimming only", file_path, guard_reason)
+                    profile = OperationProfile("none", profile.tab_size, False)
+                line_conformer.start_file(file_path)
+                cache_key = None
+                cached_result = None
+                if result_cache:
+                    file_options = f"{profile} lines:{file_line_ranges}"
+                    if profile.tab_operation == "detab-code":
+                        file_options += f" grammar:{line_conformer.code_grammar.language}"
+                    cache_key = result_cache.get_key(file_conformer.content_digest, encoding, file_options)
+                    cached_result = result_cache.load(cache_key, logger.is_change_logging_enabled)
+                if cached_result:
+                    change_count, conformed_text, changes = cached_result
+                    if conformed_text is not None:
+                        file_conformer.text = conformed_text
+                    logger.log_verbose("{}: result from cache", file_path)
+                    if changes:
+                        logger.log_changes(file_path, changes)
+                else:
+                    change_count = file_conformer.conform_lines(line_conformer.get_operations(profile), file_line_ranges,
+                                                                line_conformer.get_line_scanner(profile))
+                is_modified = file_conformer.is_modified
+                if run_profiler:
+                    run_profiler.sample()
+                if cache_key and not cached_result:
+                    result_cache.store(cache_key, change_count, file_conformer.text if is_modified else None,
+                                       file_conformer.changes)
+                if is_modified:
                     file_change_count += 1
                     if args.update:
                         logger.log(f"{file_path}: updated")
@@ -518,15 +2539,44 @@ examples:
                         logger.log(f"{file_path}: changes: {change_count}")
                 else:
                     logger.log(f"{file_path}: no changes")
+                logger.report_record("file", path=file_path, encoding=encoding, changes=change_count,
+                                     modified=is_modified, updated=is_modified and args.update, cached=bool(cached_result))
+                if journal:
+                    logger.flush()
+                    journal.record(file_path)
             except Exception as e:
                 file_error_count += 1
                 logger.log(f"{file_path}: ERROR {e}")
+                logger.report_record("error", path=file_path, message=str(e))
 
         message = f"\nFiles processed: {len(selected_files_by_path)}; with changes: {file_change_count}"
         if file_error_count > 0:
             message += f" failed: {file_error_count}"
+        if file_skip_count > 0:
+            message += f" skipped: {file_skip_count}"
+        if journal and journal.resumed_count > 0:
+            message += f" done in previous run: {journal.resumed_count}"
         logger.log(message)
+        logger.log(f"Files classified: {file_processor.classifier}")
         if file_change_count > 0 and not args.update:
             logger.log(f"Hint: Include --update to save changes")
+        logger.log_verbose("Indent cache: {}", line_conformer.indent_cache)
+        if result_cache:
+            logger.log_verbose("Result cache: {}", result_cache)
+        summary = {"processed": len(selected_files_by_path), "changed": file_change_count, "failed": file_error_count, "skipped": file_skip_count,
+                   "classified": dict(file_processor.classifier.counts)}
+        if file_select.shard:
+            summary["shard"] = str(file_select.shard)
+        if journal:
+            summary["resumed"] = journal.resumed_count
+        logger.report_record("summary", **summary)
     except AppException as e:
-        exit(e)
\ No newline at end of file
+        exit(e)
+    finally:
+        if run_profiler:
+            run_profiler.stop()
+        logger.flush()
+        if logger.report:
+            logger.report.close()
+        if journal:
+            journal.close()
\ No newline at end of file
@@ -1,7 +1,17 @@
 better_space = python_code = __import__('better-space')
+import contextlib
+import hashlib
+import io
+import json
 import shutil
+import subprocess
+import time
 import os
+import pstats
+import random
+import tarfile
 import unittest
+import zipfile
 
 TAB = "\t"
 SPACE = " "
@@ -14,6 +24,90 @@ class FakeLogger(better_space.Logger):
     def log(self, message):
         self.entries.append(message)
 
+class LoggerUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.logger = FakeLogger()
+        self.report_path = "__testreport"
+
+    def tearDown(self):
+        if os.path.isfile(self.report_path):
+            os.remove(self.report_path)
+
+    def test_log_verbose_does_not_format_message_for_non_verbose(self):
+        self.logger.log_verbose("{0.not_an_attribute}", 1)
+
+        self.assertEqual([], self.logger.entries)
+
+    def test_log_verbose_formats_message_for_verbose(self):
+        self.logger.is_verbose_enabled = True
+
+        self.logger.log_verbose("{}:{}", "a", 1)
+
+        self.assertEqual(["a:1"], self.logger.entries)
+
+    def test_log_buffers_messages_within_flush_interval(self):
+        logger = better_space.Logger(flush_interval=60)
+        output = io.StringIO()
+
+        with contextlib.redirect_stdout(output):
+            logger.log("a")
+            logger.log("b")
+            buffered_text = output.getvalue()
+            logger.flush()
+
+        self.assertEqual("", buffered_text)
+        self.assertEqual("a\nb\n", output.getvalue())
+
+    def test_log_flushes_messages_after_flush_interval(self):
+        logger = better_space.Logger(flush_interval=0.01)
+        output = io.StringIO()
+
+        with contextlib.redirect_stdout(output):
+            time.sleep(0.02)
+            logger.log("a")
+
+        self.assertEqual("a\n", output.getvalue())
+
+    def test_log_changes_writes_change_records_to_report(self):
+        self.logger.report = better_space.ReportWriter(self.report_path)
+
+        self.logger.log_changes("a.c", [(0, "changed")])
+        self.logger.report.close()
+
+        with open(self.report_path) as f: records = [json.loads(line) for line in f]
+        self.assertEqual([{"type": "change", "path": "a.c", "line": 1, "message": "changed"}], records)
+
+class RunProfilerUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.logger = FakeLogger()
+        self.profile_path = "__testprofile"
+
+    def tearDown(self):
+        if os.path.isfile(self.profile_path):
+            os.remove(self.profile_path)
+
+    def test_stop_writes_profile(self):
+        profiler = better_space.RunProfiler(self.logger, self.profile_path)
+        profiler.start()
+        better_space.LineConformer().detab_line("\ta", lambda message: message, 4)
+
+        profiler.stop()
+
+        self.assertIn("detab_line", str(pstats.Stats(self.profile_path).stats))
+
+    def test_stop_logs_allocation_sites_of_traced_classes(self):
+        profiler = better_space.RunProfiler(self.logger, traced_classes=[better_space.FileConformer])
+        profiler.start()
+        conformer = better_space.FileConformer(self.logger)
+        conformer.text = "\tabc\n" * 1000
+        conformer.conform_lines([lambda line, log : line.lstrip()])
+        profiler.sample()
+
+        profiler.stop()
+
+        self.assertTrue(self.logger.entries[0].startswith("Memory: peak: "))
+        self.assertTrue(any(entry.strip().startswith("FileConformer:") for entry in self.logger.entries[1:]))
+
 class LineConformerUnitTest(unittest.TestCase):
     def setUp(self):
         self.conformer = better_space.LineConformer()
@@ -27,6 +121,21 @@ class LineConformerUnitTest(unittest.TestCase):
         text = self.conformer.trim_trailing("  abc \t", self.log)
         self.assertEqual(text, "  abc")
 
+    #
+    # get_operations
+    #
+
+    def test_get_operations_returns_same_operations_for_same_profile(self):
+        operations = self.conformer.get_operations(better_space.OperationProfile("entab-leading", 2))
+
+        self.assertIs(operations, self.conformer.get_operations(better_space.OperationProfile("entab-leading", 2)))
+        self.assertEqual("\tx", operations[1]("  x", self.log))
+
+    def test_get_operations_omits_trim_when_leave_trailing(self):
+        operations = self.conformer.get_operations(better_space.OperationProfile("none", 4, True))
+
+        self.assertEqual([], operations)
+
     #
     # detab_line
     #
@@ -95,6 +204,92 @@ class LineConformerUnitTest(unittest.TestCase):
         text = self.conformer.detab_code_line(rf'"\\" "{TAB}XXX"', self.log, 4)
         self.assertEqual(text, r'"\\" "\tXXX"')
 
+    def test_detab_code_continues_literal_after_line_without_tab_that_ends_with_escape(self):
+        self.conformer.detab_code_line('s = "a\\', self.log, 4)
+        text = self.conformer.detab_code_line('\tb";\tc', self.log, 4)
+        self.assertEqual(text, r'\tb";' + SPACE*3 + "c")
+
+    def test_detab_code_ignores_quote_in_comment_for_c_file(self):
+        self.conformer.start_file("a.c")
+        text = self.conformer.detab_code_line("a;\t// don't\t", self.log, 4)
+        self.assertEqual(text, "a;  // don't" + SPACE*4)
+
+    def test_detab_code_replaces_tab_in_python_triple_quoted_literal_across_lines(self):
+        self.conformer.start_file("a.py")
+        self.conformer.detab_code_line('s = """', self.log, 4)
+        text = self.conformer.detab_code_line("\tXXX", self.log, 4)
+        self.assertEqual(text, r"\tXXX")
+
+    def test_detab_code_leaves_tab_in_python_raw_literal(self):
+        self.conformer.start_file("a.py")
+        text = self.conformer.detab_code_line("r'\tXXX'\t", self.log, 4)
+        self.assertEqual(text, "r'\tXXX'" + SPACE)
+
+    def test_detab_code_leaves_tab_in_cpp_raw_literal_across_lines(self):
+        self.conformer.start_file("a.cpp")
+        self.conformer.detab_code_line('s = R"x(', self.log, 4)
+        text = self.conformer.detab_code_line('\t)" )x";\t"\t"', self.log, 4)
+        self.assertEqual(text, '\t)" )x";' + SPACE*4 + r'"\t"')
+
+    def test_detab_code_continues_csharp_verbatim_literal_that_ends_with_doubled_quote(self):
+        self.conformer.start_file("a.cs")
+        self.conformer.detab_code_line('s = @"a""', self.log, 4)
+        text = self.conformer.detab_code_line('\tb";\tc', self.log, 4)
+        self.assertEqual(text, '\tb";' + SPACE*4 + "c")
+
+    def test_detab_code_treats_javascript_slash_after_operand_as_division(self):
+        self.conformer.start_file("a.js")
+        text = self.conformer.detab_code_line("x = a\t\t\t/ b;\tc();", self.log, 4)
+        self.assertEqual(text, "x = a" + SPACE*11 + "/ b;" + SPACE*4 + "c();")
+
+    def test_detab_code_treats_javascript_slash_at_start_of_line_as_division(self):
+        self.conformer.start_file("a.js")
+        text = self.conformer.detab_code_line("\t/ b / c;\td();", self.log, 4)
+        self.assertEqual(text, SPACE*4 + "/ b / c;" + SPACE*4 + "d();")
+
+    def test_detab_code_treats_javascript_slash_after_postfix_increment_as_division(self):
+        self.conformer.start_file("a.js")
+        text = self.conformer.detab_code_line("y = i++ / 2 / j;\tz();", self.log, 4)
+        self.assertEqual(text, "y = i++ / 2 / j;" + SPACE*4 + "z();")
+
+    def test_detab_code_treats_jsx_closing_tag_as_code(self):
+        self.conformer.start_file("a.jsx")
+        text = self.conformer.detab_code_line("\treturn <div>{x}</div>;\t// c", self.log, 4)
+        self.assertEqual(text, SPACE*4 + "return <div>{x}</div>;" + SPACE*2 + "// c")
+
+    def test_detab_code_opens_javascript_regex_literal_after_keyword(self):
+        self.conformer.start_file("a.js")
+        self.conformer.detab_code_line("return /`/.test(s);", self.log, 4)
+        text = self.conformer.detab_code_line("\ty = typeof /a\tb/;", self.log, 4)
+        self.assertEqual(text, SPACE*4 + r"y = typeof /a\tb/;")
+
+    def test_detab_code_treats_javascript_regex_literal_that_does_not_close_on_line_as_code(self):
+        self.conformer.start_file("a.js")
+        text = self.conformer.detab_code_line("x = (/ b;\tc();", self.log, 4)
+        self.assertEqual(text, "x = (/ b;" + SPACE*3 + "c();")
+
+    def test_detab_code_leaves_tab_in_go_raw_literal(self):
+        self.conformer.start_file("a.go")
+        text = self.conformer.detab_code_line("`\tXXX`", self.log, 4)
+        self.assertEqual(text, "`\tXXX`")
+
+    def test_detab_code_logs_closer_of_unmatched_python_literal(self):
+        self.conformer.start_file("a.py")
+        messages = []
+        self.conformer.detab_code_line("x = r'abc\tdef", messages.append, 4)
+        self.assertEqual(["Warning: Unmatched string delim (') in line: 'x = r'abc\tdef'"], messages)
+
+    def test_detab_code_leaves_template_literal_closed_after_javascript_regex_literal(self):
+        self.conformer.start_file("a.js")
+        self.conformer.detab_code_line("s = s.replace(/`/g, '');", self.log, 4)
+        text = self.conformer.detab_code_line("\treturn a / b;\t// c", self.log, 4)
+        self.assertEqual(text, "    return a / b;   // c")
+
+    def test_detab_code_replaces_tab_in_javascript_regex_literal_with_tab_specifier(self):
+        self.conformer.start_file("a.js")
+        text = self.conformer.detab_code_line("r = /a\tb/;", self.log, 4)
+        self.assertEqual(text, r"r = /a\tb/;")
+
     #
     # entab_leading
     #
@@ -156,15 +351,70 @@ class LineConformerUnitTest(unittest.TestCase):
     #     text = self.conformer.entab_line(r'std::string s("     test	");', self.log, 4)
     #     self.assertEqual(text, 'std::string\ts("\t\ttest	");')
 
+class IndentCacheUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = better_space.IndentCache(2)
+        self.convert_count = 0
+
+    def convert(self, leading, log_change, tab_size):
+        self.convert_count += 1
+        log_change("converted")
+        return leading.upper()
+
+    def test_convert_converts_once_for_same_key(self):
+        self.cache.convert("a", 4, "op", self.convert)
+
+        result = self.cache.convert("a", 4, "op", self.convert)
+
+        self.assertEqual(("A", ("converted",)), result)
+        self.assertEqual(1, self.convert_count)
+        self.assertEqual(1, self.cache.hit_count)
+        self.assertEqual(1, self.cache.miss_count)
+
+    def test_convert_keys_by_tab_size_and_operation(self):
+        self.cache.convert("a", 4, "op", self.convert)
+        self.cache.convert("a", 8, "op", self.convert)
+        self.cache.convert("a", 4, "other", self.convert)
+
+        self.assertEqual(3, self.convert_count)
+
+    def test_convert_evicts_least_recently_used(self):
+        self.cache.convert("a", 4, "op", self.convert)
+        self.cache.convert("b", 4, "op", self.convert)
+        self.cache.convert("a", 4, "op", self.convert)
+        self.cache.convert("c", 4, "op", self.convert)
+
+        self.cache.convert("a", 4, "op", self.convert)
+        self.cache.convert("b", 4, "op", self.convert)
+
+        self.assertEqual(4, self.convert_count)
+        self.assertEqual(2, len(self.cache))
+
+    def test_line_conformer_replays_change_messages_for_cached_indent(self):
+        conformer = better_space.LineConformer(self.cache)
+        messages = []
+        conformer.detab_leading("\ta", messages.append, 4)
+
+        text = conformer.detab_leading("\tb", messages.append, 4)
+
+        self.assertEqual(SPACE*4 + "b", text)
+        self.assertEqual(["Replaced tab with spaces"]*2, messages)
+        self.assertEqual(1, self.cache.hit_count)
+
 class FileConformerUnitTest(unittest.TestCase):
     def setUp(self):
-        self.conformer = better_space.FileConformer(FakeLogger())
+        self.logger = FakeLogger()
+        self.conformer = better_space.FileConformer(self.logger)
         self.test_file_path = "__testfile"
 
     def tearDown(self):
         if os.path.isfile(self.test_file_path):
             os.remove(self.test_file_path)
 
+    def __write_test_file(self, text):
+        with open(self.test_file_path, "w") as f: f.write(text)
+        return self.test_file_path
+
     def test_conform_lines_performs_operation(self):
         self.conformer.text = "a\nb\nc"
 
@@ -172,6 +422,30 @@ class FileConformerUnitTest(unittest.TestCase):
 
         self.assertEqual("==>a<==\n==>b<==\n==>c<==", self.conformer.text)
 
+    def test_conform_lines_logs_changes_with_line_numbers_for_verbose(self):
+        self.conformer.load_from_file(self.__write_test_file("a\nb"), "utf-8")
+        self.logger.is_verbose_enabled = True
+
+        self.conformer.conform_lines([lambda line, log : log("changed") or line if line == "b" else line])
+
+        self.assertEqual([f"{self.test_file_path}:2: changed"], self.logger.entries)
+
+    def test_conform_lines_keeps_changes_for_verbose(self):
+        self.conformer.load_from_file(self.__write_test_file("a\nb"), "utf-8")
+        self.logger.is_verbose_enabled = True
+
+        self.conformer.conform_lines([lambda line, log : log("changed") or line if line == "b" else line])
+
+        self.assertEqual([(1, "changed")], self.conformer.changes)
+
+    def test_conform_lines_does_not_log_changes_for_non_verbose(self):
+        self.conformer.load_from_file(self.__write_test_file("a\nb"), "utf-8")
+
+        change_count = self.conformer.conform_lines([lambda line, log : log("changed") or line])
+
+        self.assertEqual(2, change_count)
+        self.assertEqual([], self.logger.entries)
+
     def test_conform_lines_performs_each_operation(self):
         self.conformer.text = "ab"
 
@@ -179,6 +453,91 @@ class FileConformerUnitTest(unittest.TestCase):
 
         self.assertEqual("xy", self.conformer.text)
 
+    def test_conform_lines_performs_operation_only_in_line_ranges(self):
+        self.conformer.text = "a\nb\nc\nd\ne\n"
+
+        change_count = self.conformer.conform_lines([lambda line, log : log("changed") or "x"], [(4, 4), (2, 2)])
+
+        self.assertEqual("a\nx\nc\nx\ne\n", self.conformer.text)
+        self.assertEqual(2, change_count)
+
+    def test_conform_lines_performs_operation_across_chunks(self):
+        class SmallChunkFileConformer(better_space.FileConformer):
+            CHUNK_SIZE = 3
+        self.conformer = SmallChunkFileConformer(self.logger)
+        self.conformer.text = "a\nbb\n\nabcd\na"
+
+        self.conformer.conform_lines([lambda line, log : line.replace("a", "x")])
+
+        self.assertEqual("x\nbb\n\nxbcd\nx", self.conformer.text)
+
+    def test_conform_lines_leaves_unmodified_when_no_line_changes(self):
+        self.conformer.load_from_file(self.__write_test_file("a \nb"), "utf-8")
+
+        self.conformer.conform_lines([lambda line, log : line[:1] + line[1:]])
+
+        self.assertEqual(False, self.conformer.is_modified)
+
+    def test_conform_lines_ignores_line_range_beyond_end(self):
+        self.conformer.text = "a\nb"
+
+        self.conformer.conform_lines([lambda line, log : "x"], [(2, 5), (7, 9)])
+
+        self.assertEqual("a\nx", self.conformer.text)
+
+    def test_conform_lines_fails_when_time_budget_exceeded(self):
+        class SmallChunkFileConformer(better_space.FileConformer):
+            CHUNK_SIZE = 2
+        self.conformer = SmallChunkFileConformer(self.logger)
+        self.conformer.text = "a\n" * 10
+        self.conformer.time_budget = 0.01
+
+        with self.assertRaisesRegex(better_space.AppException, "time budget"):
+            self.conformer.conform_lines([lambda line, log : time.sleep(0.02) or line])
+
+    def test_conform_lines_fails_when_time_budget_exceeded_within_chunk(self):
+        self.conformer.text = "a\n" * 500
+        self.conformer.time_budget = 0.01
+
+        with self.assertRaisesRegex(better_space.AppException, "time budget"):
+            self.conformer.conform_lines([lambda line, log : time.sleep(0.001) or line])
+
+    def test_conform_lines_fails_when_time_budget_exceeded_by_last_line(self):
+        self.conformer.text = "a"
+        self.conformer.time_budget = 0.01
+
+        with self.assertRaisesRegex(better_space.AppException, "time budget"):
+            self.conformer.conform_lines([lambda line, log : time.sleep(0.02) or line])
+
+        self.assertEqual("a", self.conformer.text)
+
+    def test_conform_lines_follows_literals_of_skipped_lines_for_detab_code(self):
+        line_conformer = better_space.LineConformer()
+        line_conformer.start_file("a.py")
+        profile = better_space.OperationProfile("detab-code")
+        self.conformer.text = 's = """\n\tdoc\n"""\n\ty = 1\n'
+
+        self.conformer.conform_lines(line_conformer.get_operations(profile), [(1, 1), (4, 4)], line_conformer.get_line_scanner(profile))
+
+        self.assertEqual('s = """\n\tdoc\n"""\n    y = 1\n', self.conformer.text)
+
+    def test_conform_lines_follows_literal_opened_in_skipped_line_for_detab_code(self):
+        line_conformer = better_space.LineConformer()
+        line_conformer.start_file("a.py")
+        profile = better_space.OperationProfile("detab-code")
+        self.conformer.text = 's = """\n\tdoc\n"""\n'
+
+        self.conformer.conform_lines(line_conformer.get_operations(profile), [(2, 2)], line_conformer.get_line_scanner(profile))
+
+        self.assertEqual('s = """\n\\tdoc\n"""\n', self.conformer.text)
+
+    def test_parse_line_range_parses_start_and_end(self):
+        self.assertEqual((10, 20), better_space.FileConformer.parse_line_range("10-20"))
+        self.assertEqual((7, 7), better_space.FileConformer.parse_line_range("7"))
+
+    def test_parse_line_range_fails_for_end_before_start(self):
+        self.assertRaises(better_space.AppException, better_space.FileConformer.parse_line_range, "20-10")
+
     def test_conform_lines_preserves_empty_last_line(self):
         self.conformer.text = "a\nb\nc\n"
 
@@ -193,6 +552,20 @@ class FileConformerUnitTest(unittest.TestCase):
 
         self.assertEqual("Abc123\nDef456\n", self.conformer.text)
 
+    def test_load_from_file_converts_new_lines(self):
+        with open(self.test_file_path, "wb") as f: f.write(b"a\r\nb\rc\n")
+
+        self.conformer.load_from_file(self.test_file_path, "utf-8")
+
+        self.assertEqual("a\nb\nc\n", self.conformer.text)
+
+    def test_load_from_file_digests_content_for_digest_content(self):
+        with open(self.test_file_path, "w") as f: f.write("Abc123")
+
+        self.conformer.load_from_file(self.test_file_path, "utf-8", True)
+
+        self.assertEqual(hashlib.sha256(b"Abc123").hexdigest(), self.conformer.content_digest)
+
     def test_save_to_file_saves_to_file_loaded(self):
         with open(self.test_file_path, "w") as f: f.write("Abc123")
         self.conformer.load_from_file(self.test_file_path, "utf-8")
@@ -217,6 +590,245 @@ class FileConformerUnitTest(unittest.TestCase):
 
         self.assertEqual(True, self.conformer.is_modified)
 
+class ResultCacheUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir_path = "__testcache"
+        self.tearDown()
+        self.cache = better_space.ResultCache(self.test_dir_path)
+
+    def tearDown(self):
+        if os.path.isdir(self.test_dir_path):
+            shutil.rmtree(self.test_dir_path)
+
+    def test_load_returns_none_for_not_cached(self):
+        self.assertEqual(None, self.cache.load(self.cache.get_key("digest", "utf-8", "options")))
+        self.assertEqual(1, self.cache.miss_count)
+
+    def test_load_returns_stored_conformed_text(self):
+        key = self.cache.get_key("digest", "utf-8", "options")
+        self.cache.store(key, 2, "conformed\n")
+
+        self.assertEqual((2, "conformed\n", None), self.cache.load(key))
+        self.assertEqual(1, self.cache.hit_count)
+
+    def test_load_returns_no_text_for_stored_conformant_content(self):
+        key = self.cache.get_key("digest", "utf-8", "options")
+        self.cache.store(key, 0, None)
+
+        self.assertEqual((0, None, None), self.cache.load(key))
+
+    def test_load_is_shared_by_cache_instances_for_same_dir(self):
+        key = self.cache.get_key("digest", "utf-8", "options")
+        self.cache.store(key, 1, "text")
+
+        self.assertEqual((1, "text", None), better_space.ResultCache(self.test_dir_path).load(key))
+
+    def test_load_returns_stored_changes(self):
+        key = self.cache.get_key("digest", "utf-8", "options")
+        self.cache.store(key, 1, "text", [(0, "Trimmed trailing whitespace")])
+
+        self.assertEqual((1, "text", [(0, "Trimmed trailing whitespace")]), self.cache.load(key, with_changes=True))
+
+    def test_load_returns_none_with_changes_for_result_stored_without_changes(self):
+        key = self.cache.get_key("digest", "utf-8", "options")
+        self.cache.store(key, 1, "text")
+
+        self.assertEqual(None, self.cache.load(key, with_changes=True))
+        self.assertEqual(1, self.cache.miss_count)
+
+    def test_get_script_digest_is_digest_of_script_source(self):
+        with open(better_space.__file__, "rb") as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), better_space.ResultCache.get_script_digest())
+
+    def test_get_key_differs_by_encoding_and_options(self):
+        keys = {self.cache.get_key("digest", "utf-8", "options"),
+                self.cache.get_key("digest", "utf-16", "options"),
+                self.cache.get_key("digest", "utf-8", "other")}
+
+        self.assertEqual(3, len(keys))
+
+class ProgressJournalUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.journal_path = "__testjournal"
+        self.test_file_path = "__testfile"
+        self.journal = None
+        with open(self.test_file_path, "w") as f: f.write("abc")
+
+    def tearDown(self):
+        if self.journal:
+            self.journal.close()
+        for path in [self.journal_path, self.test_file_path]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def __open(self, options="x", resume=True):
+        if self.journal:
+            self.journal.close()
+        self.journal = better_space.ProgressJournal(self.journal_path, options, resume)
+        return self.journal
+
+    def test_is_done_is_true_for_file_recorded_by_previous_run(self):
+        self.__open().record(self.test_file_path)
+
+        self.assertEqual(True, self.__open().is_done(self.test_file_path))
+        self.assertEqual(1, self.journal.resumed_count)
+
+    def test_is_done_is_false_for_file_changed_since_recorded(self):
+        self.__open().record(self.test_file_path)
+        with open(self.test_file_path, "w") as f: f.write("abcd")
+
+        self.assertEqual(False, self.__open().is_done(self.test_file_path))
+
+    def test_is_done_is_false_when_not_resumed(self):
+        self.__open().record(self.test_file_path)
+
+        self.assertEqual(False, self.__open(resume=False).is_done(self.test_file_path))
+
+    def test_is_done_ignores_partial_line_of_stopped_run(self):
+        self.__open().close()
+        with open(self.journal_path, "a") as f: f.write('{"path": "a')
+        self.__open().record(self.test_file_path)
+
+        self.assertEqual(True, self.__open().is_done(self.test_file_path))
+
+    def test_init_fails_to_resume_run_with_different_options(self):
+        self.__open("x")
+
+        with self.assertRaises(better_space.AppException):
+            self.__open("y")
+
+class WhitespaceAuditorUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.auditor = better_space.WhitespaceAuditor()
+
+    def test_audit_text_counts_indentation_and_trailing_whitespace(self):
+        stats = self.auditor.audit_text("\ta\n    b \n \tc\nd\t\n")
+
+        self.assertEqual(4, stats["lines"])
+        self.assertEqual((1, 2, 1), (stats["tab_indented"], stats["space_indented"], stats["mixed_indented"]))
+        self.assertEqual(2, stats["trailing"])
+        self.assertEqual("mixed", stats["indent"])
+
+    def test_audit_text_counts_trailing_whitespace_that_trim_removes(self):
+        stats = self.auditor.audit_text("a\x0c\nb \n\nc　 \nd")
+
+        self.assertEqual(3, stats["trailing"])
+        self.assertEqual(["trim"], stats["would_change"])
+
+    def test_audit_text_classifies_tab_indentation(self):
+        self.assertEqual("tabs", self.auditor.audit_text("\ta\n\t\tb")["indent"])
+
+    def test_audit_text_determines_operations_that_would_change_text(self):
+        self.assertEqual(["detab-leading", "detab-text", "detab-code"], self.auditor.audit_text("\ta")["would_change"])
+        self.assertEqual(["entab-leading"], self.auditor.audit_text("    a")["would_change"])
+        self.assertEqual(["detab-text", "detab-code"], self.auditor.audit_text("a\tb")["would_change"])
+
+    def test_audit_file_aggregates_totals(self):
+        file_conformer = better_space.FileConformer(FakeLogger())
+        test_file_path = "__testfile"
+        try:
+            with open(test_file_path, "w") as f: f.write("\ta \n")
+            self.auditor.audit_file(file_conformer, test_file_path, "utf-8")
+            self.auditor.audit_file(file_conformer, test_file_path, "utf-8")
+        finally:
+            os.remove(test_file_path)
+
+        self.assertEqual(2, self.auditor.file_count)
+        self.assertEqual(2, self.auditor.totals["indent tabs"])
+        self.assertEqual(2, self.auditor.totals["changed by trim"])
+
+@unittest.skipIf(shutil.which("git") is None, "requires git")
+class GitChangesUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir_path = "__testrepo"
+        self.tearDown()
+        os.mkdir(self.test_dir_path)
+        self.__git("init", "-q")
+        self.__write_file("a", "1\n2\n3\n4\n")
+        self.__write_file("b", "1\n")
+        self.__git("add", "a", "b")
+        self.__git("-c", "user.name=test", "-c", "user.email=test@test", "commit", "-q", "-m", "initial")
+
+    def tearDown(self):
+        if os.path.isdir(self.test_dir_path):
+            shutil.rmtree(self.test_dir_path, onerror=lambda func, path, _: (os.chmod(path, 0o700), func(path)))
+
+    def __git(self, *args):
+        subprocess.run(["git"] + list(args), cwd=self.test_dir_path, check=True, capture_output=True)
+
+    def __write_file(self, name, text):
+        path = os.path.join(self.test_dir_path, name)
+        with open(path, "w") as f: f.write(text)
+        return path
+
+    def test_get_line_ranges_returns_changed_lines(self):
+        path = self.__write_file("a", "1\nX\n3\n4\nY\nZ\n")
+
+        self.assertEqual([(2, 2), (5, 6)], better_space.GitChanges().get_line_ranges(path))
+
+    def test_get_line_ranges_returns_empty_for_unchanged_file(self):
+        self.assertEqual([], better_space.GitChanges().get_line_ranges(os.path.join(self.test_dir_path, "b")))
+
+    def test_get_line_ranges_returns_none_for_untracked_file(self):
+        path = self.__write_file("c", "new\n")
+
+        self.assertEqual(None, better_space.GitChanges().get_line_ranges(path))
+
+    def test_get_line_ranges_conforms_only_changed_lines_with_detab_code(self):
+        path = self.__write_file("c.py", 's = """\n\tdoc\n"""\ny = 1\n')
+        self.__git("add", "c.py")
+        self.__git("-c", "user.name=test", "-c", "user.email=test@test", "commit", "-q", "-m", "docstring")
+        self.__write_file("c.py", 's = """ \n\tdoc\n"""\n\ty = 1\n')
+        line_conformer = better_space.LineConformer()
+        line_conformer.start_file(path)
+        profile = better_space.OperationProfile("detab-code")
+        file_conformer = better_space.FileConformer(FakeLogger())
+        file_conformer.load_from_file(path, "utf-8")
+
+        file_conformer.conform_lines(line_conformer.get_operations(profile), better_space.GitChanges().get_line_ranges(path),
+                                     line_conformer.get_line_scanner(profile))
+
+        self.assertEqual('s = """\n\tdoc\n"""\n    y = 1\n', file_conformer.text)
+
+    def test_get_line_ranges_handles_diff_with_content_that_is_not_utf8(self):
+        with open(os.path.join(self.test_dir_path, "b"), "wb") as f: f.write(b"caf\xe9\n")
+        path = self.__write_file("a", "1\nX\n3\n4\n")
+
+        self.assertEqual([(2, 2)], better_space.GitChanges().get_line_ranges(path))
+
+    def test_get_line_ranges_fails_for_each_file_when_git_fails(self):
+        shutil.rmtree(os.path.join(self.test_dir_path, ".git"))
+        self.__git("init", "-q") # without HEAD
+        git_changes = better_space.GitChanges()
+
+        for name in ["a", "b"]:
+            with self.assertRaises(better_space.AppException):
+                git_changes.get_line_ranges(os.path.join(self.test_dir_path, name))
+
+    def test_get_line_ranges_returns_changed_lines_after_added_line_that_looks_like_header(self):
+        path = self.__write_file("a", "1\n++ x\n3\nY\n")
+
+        self.assertEqual([(2, 2), (4, 4)], better_space.GitChanges().get_line_ranges(path))
+
+    def test_get_line_ranges_returns_changed_lines_when_diff_has_no_prefix(self):
+        self.__git("config", "diff.noprefix", "true")
+        path = self.__write_file("a", "1\nX\n3\n4\n")
+
+        self.assertEqual([(2, 2)], better_space.GitChanges().get_line_ranges(path))
+
+    def test_get_line_ranges_returns_changed_lines_via_symbolic_link(self):
+        link_path = self.test_dir_path + "-link"
+        try:
+            os.symlink(os.path.abspath(self.test_dir_path), link_path)
+        except (OSError, NotImplementedError):
+            self.skipTest("symbolic links not supported")
+        try:
+            self.__write_file("a", "1\nX\n3\n4\n")
+
+            self.assertEqual([(2, 2)], better_space.GitChanges().get_line_ranges(os.path.join(link_path, "a")))
+        finally:
+            os.remove(link_path)
+
 class FileSelectUnitTest(unittest.TestCase):
     def setUp(self):
         self.select = better_space.FileSelect()
@@ -225,6 +837,365 @@ class FileSelectUnitTest(unittest.TestCase):
         with self.assertRaises(better_space.AppException):
             self.select.depth_limit = -1
  
+class ConfigResolverUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir_path = "__testdir"
+        self.tearDown()
+        os.makedirs(os.path.join(self.test_dir_path, "sub", "deep"))
+        self.default_profile = better_space.OperationProfile()
+        self.resolver = better_space.ConfigResolver(self.default_profile)
+
+    def tearDown(self):
+        if os.path.isdir(self.test_dir_path):
+            shutil.rmtree(self.test_dir_path)
+
+    def __write_config(self, dir_path, text):
+        with open(os.path.join(self.test_dir_path, dir_path, better_space.ConfigResolver.FILE_NAME), "w") as f:
+            f.write(text)
+
+    def __get_profile(self, path):
+        return self.resolver.get_profile(os.path.join(self.test_dir_path, path)).key
+
+    def test_get_profile_returns_default_without_matching_pattern(self):
+        self.__write_config("", "root = true\n[*.py]\ntab-size = 2\n")
+
+        self.assertIs(self.default_profile, self.resolver.get_profile(os.path.join(self.test_dir_path, "a.c")))
+
+    def test_get_profile_applies_matching_section(self):
+        self.__write_config("", "root = true\n[Makefile]\ntab-operation = entab-leading # make needs tabs\n[*.py]\ntab-size = 2\nleave-trailing = true\n")
+
+        self.assertEqual(("entab-leading", 4, False), self.__get_profile("Makefile"))
+        self.assertEqual(("detab-leading", 2, True), self.__get_profile(os.path.join("sub", "a.py")))
+
+    def test_get_profile_prefers_config_of_subdirectory(self):
+        self.__write_config("", "root = true\n[*]\ntab-operation = entab-leading\ntab-size = 8\n")
+        self.__write_config("sub", "[*.go]\ntab-size = 4\n")
+
+        self.assertEqual(("entab-leading", 8, False), self.__get_profile("a.go"))
+        self.assertEqual(("entab-leading", 4, False), self.__get_profile(os.path.join("sub", "deep", "a.go")))
+
+    def test_get_profile_ignores_configs_above_root(self):
+        self.__write_config("", "root = true\n[*]\ntab-size = 8\n")
+        self.__write_config("sub", "root = true\n[*.c]\ntab-operation = detab-code\n")
+
+        self.assertEqual(("detab-code", 4, False), self.__get_profile(os.path.join("sub", "a.c")))
+
+    def test_get_profile_matches_relative_path_for_pattern_with_slash(self):
+        self.__write_config("", "root = true\n[sub/deep/*]\ntab-operation = none\n")
+
+        self.assertEqual(("none", 4, False), self.__get_profile(os.path.join("sub", "deep", "a.c")))
+        self.assertEqual(("detab-leading", 4, False), self.__get_profile(os.path.join("sub", "a.c")))
+
+    def test_get_profile_prefers_overrides(self):
+        self.resolver = better_space.ConfigResolver(self.default_profile, {"tab-size": 3})
+        self.__write_config("", "root = true\n[*]\ntab-operation = entab-leading\ntab-size = 8\n")
+
+        self.assertEqual(("entab-leading", 3, False), self.__get_profile("a.c"))
+
+    def test_get_profile_returns_same_profile_for_same_settings(self):
+        self.__write_config("", "root = true\n[*.h]\ntab-size = 2\n[*.c]\ntab-size = 2\n")
+
+        self.assertIs(self.resolver.get_profile(os.path.join(self.test_dir_path, "a.c")),
+                      self.resolver.get_profile(os.path.join(self.test_dir_path, "sub", "a.h")))
+
+    def test_get_profile_fails_for_invalid_setting(self):
+        self.__write_config("", "[*]\ntab-operation = sideways\n")
+
+        with self.assertRaisesRegex(better_space.AppException, r"\.better-space:2: Unknown operation"):
+            self.__get_profile("a.c")
+
+class FileShardUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir_path = "__testdir"
+        self.tearDown()
+        os.mkdir(self.test_dir_path)
+
+    def tearDown(self):
+        if os.path.isdir(self.test_dir_path):
+            shutil.rmtree(self.test_dir_path)
+
+    def __create_files(self, sizes):
+        file_paths = []
+        for i, size in enumerate(sizes):
+            file_path = os.path.join(self.test_dir_path, f"f{i}")
+            with open(file_path, "w") as f: f.write("x" * size)
+            file_paths.append(file_path)
+        return file_paths
+
+    def test_parse_parses_index_and_count(self):
+        shard = better_space.FileShard.parse("2/4")
+
+        self.assertEqual((2, 4), (shard.index, shard.count))
+
+    def test_parse_fails_for_index_out_of_range(self):
+        self.assertRaises(better_space.AppException, better_space.FileShard.parse, "0/4")
+        self.assertRaises(better_space.AppException, better_space.FileShard.parse, "5/4")
+
+    def test_parse_fails_for_invalid_format(self):
+        self.assertRaises(better_space.AppException, better_space.FileShard.parse, "2")
+
+    def test_select_selects_each_file_in_exactly_one_shard(self):
+        file_paths = [f"dir/file{i}.c" for i in range(100)]
+
+        selected = [path for index in range(1, 4) for path in better_space.FileShard(index, 3).select(file_paths)]
+
+        self.assertCountEqual(file_paths, selected)
+
+    def test_select_is_deterministic(self):
+        file_paths = [f"dir/file{i}.c" for i in range(100)]
+
+        self.assertEqual(better_space.FileShard(2, 3).select(file_paths), better_space.FileShard(2, 3).select(list(file_paths)))
+
+    def test_select_balances_total_size_when_size_balanced(self):
+        file_paths = self.__create_files([90, 50, 40, 10])
+
+        selected = [better_space.FileShard(index, 2, True).select(file_paths) for index in range(1, 3)]
+
+        self.assertEqual([[file_paths[0], file_paths[3]], [file_paths[1], file_paths[2]]], selected)
+
+class ReportMergerUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.logger = FakeLogger()
+        self.report_paths = ["__testreport1", "__testreport2", "__testreport"]
+
+    def tearDown(self):
+        for path in self.report_paths:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def __write_report(self, path, shard, processed):
+        report = better_space.ReportWriter(path)
+        report.write("file", path=f"{shard}.c")
+        report.write("summary", processed=processed, changed=1, failed=0, shard=shard)
+        report.close()
+
+    def test_merge_combines_records_and_summaries(self):
+        self.__write_report(self.report_paths[0], "1/2", 3)
+        self.__write_report(self.report_paths[1], "2/2", 4)
+
+        summary = better_space.ReportMerger(self.logger).merge(self.report_paths[:2], self.report_paths[2])
+
+        with open(self.report_paths[2]) as f: records = [json.loads(line) for line in f]
+        self.assertEqual((7, 2), (summary["processed"], summary["changed"]))
+        self.assertEqual(["file", "file", "summary"], [record["type"] for record in records])
+        self.assertEqual([], self.logger.entries)
+
+    def test_merge_warns_for_missing_shard(self):
+        self.__write_report(self.report_paths[0], "1/2", 3)
+
+        better_space.ReportMerger(self.logger).merge(self.report_paths[:1], self.report_paths[2])
+
+        self.assertEqual(["Warning: missing shard(s) 2 of 2"], self.logger.entries)
+
+class FileClassifierUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.classifier = better_space.FileClassifier()
+        self.test_file_path = "__testfile"
+
+    def tearDown(self):
+        if os.path.isfile(self.test_file_path):
+            os.remove(self.test_file_path)
+
+    def __write_file(self, content, extension=""):
+        self.test_file_path = "__testfile" + extension
+        with open(self.test_file_path, "wb") as f: f.write(content)
+        return self.test_file_path
+
+    def test_classify_classifies_binary_extension_without_opening(self):
+        result = self.classifier.classify("not-there.PNG")
+
+        self.assertEqual((better_space.FileClassifier.BINARY_BY_EXTENSION, None), result)
+
+    def test_classify_head_classifies_content_not_in_file(self):
+        result = self.classifier.classify_head("dir/a.c", b"int x;\n")
+
+        self.assertEqual((better_space.FileClassifier.TEXT_BY_EXTENSION, "utf-8"), result)
+
+    def test_classify_classifies_binary_signature(self):
+        result = self.classifier.classify(self.__write_file(b"\x7fELF text after signature"))
+
+        self.assertEqual((better_space.FileClassifier.BINARY_BY_CONTENT, None), result)
+
+    def test_classify_classifies_nul_as_binary(self):
+        result = self.classifier.classify(self.__write_file(b"abc\x00def"))
+
+        self.assertEqual((better_space.FileClassifier.BINARY_BY_CONTENT, None), result)
+
+    def test_classify_classifies_utf16_as_text(self):
+        result = self.classifier.classify(self.__write_file("abc".encode("utf-16")))
+
+        self.assertEqual((better_space.FileClassifier.TEXT_BY_CONTENT, "utf-16"), result)
+
+    def test_classify_classifies_text_extension(self):
+        result = self.classifier.classify(self.__write_file(b"abc", ".c"))
+
+        self.assertEqual((better_space.FileClassifier.TEXT_BY_EXTENSION, "utf-8"), result)
+
+    def test_add_text_extension_overrides_binary_extension(self):
+        self.classifier.add_text_extension("png")
+
+        result = self.classifier.classify(self.__write_file(b"abc", ".png"))
+
+        self.assertEqual((better_space.FileClassifier.TEXT_BY_EXTENSION, "utf-8"), result)
+
+    def test_classify_counts_classifications(self):
+        self.classifier.classify("a.png")
+        self.classifier.classify("b.png")
+
+        self.assertEqual({better_space.FileClassifier.BINARY_BY_EXTENSION: 2}, self.classifier.counts)
+
+class ContentGuardUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.guard = better_space.ContentGuard()
+        self.test_file_path = "__testfile.min.js"
+
+    def tearDown(self):
+        if os.path.isfile(self.test_file_path):
+            os.remove(self.test_file_path)
+
+    def test_check_text_returns_none_when_not_enabled(self):
+        self.assertEqual(False, self.guard.is_enabled)
+        self.assertIsNone(self.guard.check_text("x" * 100000))
+
+    def test_check_text_guards_line_longer_than_max(self):
+        self.guard.max_line_length = 4
+
+        self.assertIsNone(self.guard.check_text("abcd\nabcd"))
+        self.assertEqual("line length 5 exceeds 4", self.guard.check_text("abcd\nabcde\nabc"))
+
+    def test_check_text_guards_minified_content(self):
+        self.guard.detect_generated = True
+
+        self.assertIsNone(self.guard.check_text("x = 1;\n" * 1000))
+        self.assertEqual("minified by average line length", self.guard.check_text("x=1;" * 1000 + "\n"))
+
+    def test_check_text_guards_generated_content(self):
+        self.guard.detect_generated = True
+
+        self.assertEqual("generated by marker 'DO NOT EDIT'", self.guard.check_text("// Code generated by stringer. DO NOT EDIT.\n"))
+
+    def test_check_file_guards_file_larger_than_max_size(self):
+        with open(self.test_file_path, "w") as f: f.write("abcde")
+        self.guard.max_file_size = 4
+
+        self.assertEqual("file size 5 exceeds 4", self.guard.check_file(self.test_file_path))
+
+    def test_check_file_guards_minified_file_by_name(self):
+        self.guard.detect_generated = True
+
+        self.assertEqual("minified by name", self.guard.check_file(self.test_file_path))
+
+    def test_check_size_and_name_guards_content_larger_than_max_size(self):
+        self.guard.max_file_size = 4
+
+        self.assertIsNone(self.guard.check_size_and_name(4, "a.c"))
+        self.assertEqual("file size 5 exceeds 4", self.guard.check_size_and_name(5, "a.c"))
+
+    def test_find_line_longer_than_finds_last_line(self):
+        self.assertEqual(6, better_space.ContentGuard.find_line_longer_than("ab\nabc\nabcdef", 5))
+
+class ArchiveConformerUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir_path = "__testdir"
+        self.tearDown()
+        os.mkdir(self.test_dir_path)
+        self.logger = FakeLogger()
+        self.archive_conformer = better_space.ArchiveConformer(self.logger, better_space.FileClassifier(),
+            better_space.FileConformer(self.logger), better_space.LineConformer(), better_space.ContentGuard())
+        self.members = {"src/a.c": b"\tint x; \n", "src/b.txt": b"ok\n", "src/i.png": b"\x89PNG\r\n\x1a\n\t \n"}
+
+    def tearDown(self):
+        if os.path.isdir(self.test_dir_path):
+            shutil.rmtree(self.test_dir_path)
+
+    def __get_path(self, name):
+        return os.path.join(self.test_dir_path, name)
+
+    def test_conform_writes_zip_with_conformed_text_members(self):
+        with zipfile.ZipFile(self.__get_path("in.zip"), "w") as zip_file:
+            for name, data in self.members.items():
+                zip_file.writestr(name, data)
+
+        self.archive_conformer.conform(self.__get_path("in.zip"), better_space.OperationProfile(), self.__get_path("out.zip"))
+
+        with zipfile.ZipFile(self.__get_path("out.zip")) as zip_file:
+            members = {name: zip_file.read(name) for name in zip_file.namelist()}
+        self.assertEqual({**self.members, "src/a.c": b"    int x;\n"}, members)
+        self.assertEqual((2, 1), (self.archive_conformer.member_count, self.archive_conformer.change_count))
+
+    def test_conform_writes_tar_with_conformed_text_members(self):
+        with tarfile.open(self.__get_path("in.tar.gz"), "w:gz") as tar_file:
+            for name, data in self.members.items():
+                member = tarfile.TarInfo(name)
+                member.size = len(data)
+                tar_file.addfile(member, io.BytesIO(data))
+
+        self.archive_conformer.conform(self.__get_path("in.tar.gz"), better_space.OperationProfile(), self.__get_path("out.tgz"))
+
+        with tarfile.open(self.__get_path("out.tgz"), "r:gz") as tar_file:
+            members = {member.name: tar_file.extractfile(member).read() for member in tar_file}
+        self.assertEqual({**self.members, "src/a.c": b"    int x;\n"}, members)
+
+    def test_conform_only_checks_without_output(self):
+        with zipfile.ZipFile(self.__get_path("in.zip"), "w") as zip_file:
+            zip_file.writestr("a.c", b"x \n")
+
+        self.archive_conformer.conform(self.__get_path("in.zip"), better_space.OperationProfile())
+
+        self.assertEqual([f"{self.__get_path('in.zip')}!a.c: changes: 1"], self.logger.entries)
+        self.assertEqual(["in.zip"], os.listdir(self.test_dir_path))
+
+    def test_conform_skips_member_larger_than_max_file_size(self):
+        content_guard = better_space.ContentGuard()
+        content_guard.max_file_size = 4
+        archive_conformer = better_space.ArchiveConformer(self.logger, better_space.FileClassifier(),
+            better_space.FileConformer(self.logger), better_space.LineConformer(), content_guard)
+        with zipfile.ZipFile(self.__get_path("in.zip"), "w") as zip_file:
+            zip_file.writestr("a.c", b"\tx \n")
+            zip_file.writestr("b.c", b"\tx = 1;\n")
+
+        archive_conformer.conform(self.__get_path("in.zip"), better_space.OperationProfile(), self.__get_path("out.zip"))
+
+        with zipfile.ZipFile(self.__get_path("out.zip")) as zip_file:
+            members = {name: zip_file.read(name) for name in zip_file.namelist()}
+        self.assertEqual({"a.c": b"    x\n", "b.c": b"\tx = 1;\n"}, members)
+        self.assertEqual(1, archive_conformer.skip_count)
+
+    def test_conform_fails_and_deletes_output_for_zip_with_bad_crc(self):
+        with zipfile.ZipFile(self.__get_path("in.zip"), "w") as zip_file:
+            zip_file.writestr("d/", b"")
+            zip_file.writestr("d/a.c", b"\tint x;\n")
+        with open(self.__get_path("in.zip"), "r+b") as f:
+            data = f.read()
+            f.seek(data.index(b"int x;"))
+            f.write(b"INT")
+
+        with self.assertRaisesRegex(better_space.AppException, "in.zip"):
+            self.archive_conformer.conform(self.__get_path("in.zip"), better_space.OperationProfile(), self.__get_path("out.zip"))
+
+        self.assertEqual(["in.zip"], os.listdir(self.test_dir_path))
+
+    def test_conform_fails_and_deletes_output_for_truncated_tar(self):
+        with tarfile.open(self.__get_path("in.tar.gz"), "w:gz") as tar_file:
+            for i in range(4):
+                data = bytes(random.Random(i).choices(b"ab \t\n", k=20000))
+                member = tarfile.TarInfo(f"m{i}.c")
+                member.size = len(data)
+                tar_file.addfile(member, io.BytesIO(data))
+        with open(self.__get_path("in.tar.gz"), "r+b") as f:
+            f.truncate(os.path.getsize(self.__get_path("in.tar.gz")) // 2)
+
+        with self.assertRaisesRegex(better_space.AppException, "in.tar.gz"):
+            self.archive_conformer.conform(self.__get_path("in.tar.gz"), better_space.OperationProfile(), self.__get_path("out.tgz"))
+
+        self.assertEqual(["in.tar.gz"], os.listdir(self.test_dir_path))
+
+    def test_conform_fails_for_file_that_is_not_archive(self):
+        with open(self.__get_path("a.c"), "w") as f: f.write("x")
+
+        with self.assertRaises(better_space.AppException):
+            self.archive_conformer.conform(self.__get_path("a.c"), better_space.OperationProfile())
+
 class FileProcessorUnitTest(unittest.TestCase):
     def setUp(self):
         self.processor = better_space.FileProcessor(FakeLogger())
@@ -406,5 +1377,271 @@ class FileProcessorUnitTest(unittest.TestCase):
 
         self.assertCountEqual([root_file_path, child_dir_file_path], file_paths)
 
+class ReferenceLineConformer(object):
+    '''
+    Straightforward char-by-char implementations of the line operations as originally written; the
+    reference that the optimized engines of LineConformer and FileConformer are compared against
+    '''
+
+    def __init__(self):
+        self.__continued_quote = None
+
+    def start_file(self):
+        self.__continued_quote = None
+
+    def trim_trailing(self, line, log_change):
+        result = line.rstrip()
+        if result != line:
+            log_change("Trimmed trailing whitespace")
+        return result
+
+    def __split_leading_whitespace(self, line):
+        for i, c in enumerate(line):
+            if c != SPACE and c != TAB:
+                return line[:i], line[i:]
+        return line, ""
+
+    def detab_leading(self, line, log_change, tab_size):
+        leading, post_leading = self.__split_leading_whitespace(line)
+        return self.detab_line(leading, log_change, tab_size) + post_leading
+
+    def detab_line(self, line, log_change, tab_size):
+        out_line = io.StringIO()
+        for c in line:
+            if c == TAB:
+                out_line.write(SPACE * (tab_size - out_line.tell() % tab_size))
+                log_change("Replaced tab with spaces")
+            else:
+                out_line.write(c)
+        return out_line.getvalue()
+
+    def detab_code_line(self, line, log_change, tab_size):
+        '''Detabs a line for the generic grammar; a literal that ends with an escape continues on the next line'''
+        out_line = io.StringIO()
+        start_quote = self.__continued_quote
+        escape_next = False
+        for c in line:
+            if c == "\\" and start_quote and not escape_next:
+                escape_next = True
+                out_line.write(c)
+                continue
+            if c in "'\"" and not escape_next:
+                if not start_quote:
+                    start_quote = c
+                elif c == start_quote:
+                    start_quote = None
+                out_line.write(c)
+            elif c == TAB and start_quote:
+                out_line.write(r"\t")
+                log_change(r"Replaced tab with \t in string literal")
+            elif c == TAB:
+                out_line.write(SPACE * (tab_size - out_line.tell() % tab_size))
+                log_change("Replaced tab with spaces")
+            else:
+                out_line.write(c)
+            escape_next = False
+        if start_quote and not escape_next and TAB in line:
+            log_change(f"Warning: Unmatched string delim ({start_quote}) in line: '{line}'")
+        self.__continued_quote = start_quote if escape_next else None
+        return out_line.getvalue()
+
+    def entab_leading(self, line, log_change, tab_size):
+        leading, post_leading = self.__split_leading_whitespace(line)
+        out_line = io.StringIO()
+        logical_len = 0
+        space_count = 0
+        for c in leading:
+            if c == SPACE:
+                if logical_len % tab_size == tab_size - 1:
+                    log_change(f"Replaced {space_count + 1} space(s) with tab")
+                    out_line.write(TAB)
+                    space_count = 0
+                else:
+                    space_count += 1
+                logical_len += 1
+            else:
+                if space_count > 0:
+                    log_change(f"Dropping {space_count} space(s) for existing tab")
+                out_line.write(TAB)
+                space_count = 0
+                logical_len += tab_size - logical_len % tab_size
+        return out_line.getvalue() + post_leading
+
+    def conform_lines(self, text, operations, line_ranges=None, scan=None):
+        '''
+        Returns the text with operations applied to each line (in line_ranges) and the change messages;
+        scan is called for each line that is not in line_ranges
+        '''
+        messages = []
+        lines = text.split("\n")
+        selected_indexes = set(range(len(lines))) if line_ranges is None else set(
+            index for start, end in line_ranges for index in range(start - 1, end))
+        for index in range(len(lines)):
+            if index in selected_indexes:
+                for operation in operations:
+                    lines[index] = operation(lines[index], lambda message: messages.append((index, message)))
+            elif scan:
+                scan(lines[index])
+        return "\n".join(lines), messages
+
+class DifferentialUnitTest(unittest.TestCase):
+    '''
+    Compares the optimized engines with ReferenceLineConformer for randomly generated lines and texts
+    of mixed tabs, spaces, quotes, escapes and unicode and checks properties of detab-code that hold for
+    the grammar of each language. Runs a fixed number of cases with a fixed seed;
+    for a long run, set environment variables such as:
+        BETTER_SPACE_FUZZ_CASES=1000000 BETTER_SPACE_FUZZ_SEED=7 python unit-test.py DifferentialUnitTest
+    '''
+
+    CHARS = [SPACE] * 6 + [TAB] * 4 + ["'", '"', "\\"] * 2 + list("ab_(;") + ["é", "中", "\U0001f600", "　", "\x0c", "\r"]
+
+    # the tokens of the literals and comments of all grammars
+    CODE_TOKENS = [SPACE] * 4 + [TAB] * 4 + ["\n"] * 3 + ["'", '"', '"""', "`", "/", "*", "#", "\\", "r", "R", "(", ")", "@", "a", "1"]
+
+    # complete literals and comments without tabs by file name; in parentheses so a JavaScript '/' is not
+    # division and a line comment with the end of its line
+    LITERALS_BY_FILE_NAME = {
+        "a.txt": ['"a b"', "'a'", '"a\\"b"'],
+        "a.c": ['"a"', "'a'", "// a ' b\n", "/* a\n' b */", 'R"x(a\n)" b)x"'],
+        "a.cs": ['"a"', "'a'", "// a ' b\n", "/* a */", '@"a""\nb"', '"""a\n"" b"""'],
+        "a.py": ['"a"', "'a'", "# a ' b\n", '"""a\n\' b"""', "r'a\\d'", "b'a'", "'a\\\nb'"],
+        "a.js": ['"a"', "'a'", "// a ' b\n", "/* a */", "`a\n' b`", "/a`b/g"],
+        "a.go": ['"a"', "'a'", "// a ' b\n", "`a\n\\`"],
+    }
+
+    def setUp(self):
+        self.case_count = int(os.environ.get("BETTER_SPACE_FUZZ_CASES", 3000))
+        self.seed = int(os.environ.get("BETTER_SPACE_FUZZ_SEED", 1))
+        self.random = random.Random(self.seed)
+        self.conformer = better_space.LineConformer()
+        self.reference = ReferenceLineConformer()
+
+    def __generate_line(self):
+        # lead with whitespace since most engines handle indentation specially
+        leading = "".join(self.random.choices([SPACE, TAB], k=self.random.randint(0, 10)))
+        return leading + "".join(self.random.choices(self.CHARS, k=self.random.randint(0, 24)))
+
+    def __generate_text(self):
+        return "\n".join(self.__generate_line() for _ in range(self.random.randint(0, 12)))
+
+    def __generate_line_ranges(self):
+        return None if self.random.random() < 0.5 else [
+            tuple(sorted(self.random.choices(range(1, 15), k=2))) for _ in range(self.random.randint(1, 3))]
+
+    def __conform_code(self, file_name, text, profile, line_ranges=None):
+        '''Returns text conformed like a file with an OperationProfile'''
+        self.conformer.start_file(file_name)
+        file_conformer = better_space.FileConformer(FakeLogger())
+        file_conformer.load_from_bytes(text.encode("utf-8"), "utf-8", file_name)
+        file_conformer.conform_lines(self.conformer.get_operations(profile), line_ranges,
+                                     self.conformer.get_line_scanner(profile))
+        return file_conformer.text
+
+    def __assert_same_line_results(self, operation_name, prepare=None):
+        operation = getattr(self.conformer, operation_name)
+        reference_operation = getattr(self.reference, operation_name)
+        for _ in range(self.case_count):
+            line = self.__generate_line()
+            tab_size = self.random.randint(1, 8)
+            if prepare:
+                prepare()
+            messages = []
+            reference_messages = []
+            result = operation(line, messages.append, tab_size)
+            reference_result = reference_operation(line, reference_messages.append, tab_size)
+            self.assertEqual((reference_result, reference_messages), (result, messages),
+                             f"{operation_name}({line!r}, tab_size={tab_size}); seed {self.seed}")
+
+    def test_detab_line_matches_reference(self):
+        self.__assert_same_line_results("detab_line")
+
+    def test_detab_leading_matches_reference(self):
+        self.__assert_same_line_results("detab_leading")
+
+    def test_entab_leading_matches_reference(self):
+        self.__assert_same_line_results("entab_leading")
+
+    def test_detab_code_line_matches_reference_for_generic_grammar(self):
+        # each line starts fresh so that a failing case can be reproduced by itself
+        self.__assert_same_line_results("detab_code_line", lambda: (self.conformer.start_file("a.txt"), self.reference.start_file()))
+
+    def test_trim_trailing_matches_reference(self):
+        for _ in range(self.case_count):
+            line = self.__generate_line()
+            messages = []
+            reference_messages = []
+            result = self.conformer.trim_trailing(line, messages.append)
+            self.assertEqual((self.reference.trim_trailing(line, reference_messages.append), reference_messages),
+                             (result, messages), f"trim_trailing({line!r}); seed {self.seed}")
+
+    def test_conform_lines_matches_reference(self):
+        logger = FakeLogger()
+        logger.is_verbose_enabled = True
+        for _ in range(self.case_count // 10):
+            class SmallChunkFileConformer(better_space.FileConformer):
+                CHUNK_SIZE = self.random.randint(1, 32)
+            file_conformer = SmallChunkFileConformer(logger)
+            # loading converts CR to a new line
+            text = self.__generate_text().replace("\r", "\n")
+            tab_size = self.random.randint(1, 8)
+            operation_name = self.random.choice(["detab_leading", "entab_leading", "detab_line", "detab_code_line"])
+            line_ranges = self.__generate_line_ranges()
+            operation = getattr(self.conformer, operation_name)
+            reference_operation = getattr(self.reference, operation_name)
+            self.conformer.start_file("a")
+            self.reference.start_file()
+            scan = self.conformer.get_line_scanner(better_space.OperationProfile("detab-code")) \
+                if operation_name == "detab_code_line" else None
+            reference_scan = (lambda line: self.reference.detab_code_line(line, lambda message: None, 1)) if scan else None
+            file_conformer.load_from_bytes(text.encode("utf-8"), "utf-8", "a")
+            logger.entries.clear()
+
+            change_count = file_conformer.conform_lines(
+                [self.conformer.trim_trailing, lambda line, log: operation(line, log, tab_size)], line_ranges, scan)
+
+            reference_text, reference_messages = self.reference.conform_lines(
+                text, [self.reference.trim_trailing, lambda line, log: reference_operation(line, log, tab_size)], line_ranges,
+                reference_scan)
+            self.assertEqual((reference_text, len(reference_messages), reference_text != text),
+                             (file_conformer.text, change_count, file_conformer.is_modified),
+                             f"conform_lines({text!r}) with {operation_name}, tab_size={tab_size}, line_ranges={line_ranges}, "
+                             f"chunk_size={SmallChunkFileConformer.CHUNK_SIZE}; seed {self.seed}")
+            self.assertEqual([f"a:{index + 1}: {message}" for index, message in reference_messages], logger.entries)
+
+    def test_ranged_conform_lines_matches_full_conform_for_detab_code(self):
+        for _ in range(self.case_count // 10):
+            # trailing whitespace is left since trimming a skipped line can legitimately change where a literal ends
+            profile = better_space.OperationProfile("detab-code", self.random.randint(1, 8), leave_trailing=True)
+            line_ranges = self.__generate_line_ranges() or [(1, 14)]
+            selected_indexes = set(index for start, end in line_ranges for index in range(start - 1, end))
+            for file_name in self.LITERALS_BY_FILE_NAME:
+                text = "".join(self.random.choices(self.CODE_TOKENS, k=self.random.randint(0, 60)))
+                full_lines = self.__conform_code(file_name, text, profile).split("\n")
+
+                ranged_text = self.__conform_code(file_name, text, profile, line_ranges)
+
+                expected_text = "\n".join(full_lines[index] if index in selected_indexes else line
+                                          for index, line in enumerate(text.split("\n")))
+                self.assertEqual(expected_text, ranged_text, f"conform_lines({text!r}) of {file_name} with "
+                                 f"tab_size={profile.tab_size}, line_ranges={line_ranges}; seed {self.seed}")
+
+    def test_detab_code_leaves_no_tab_specifier_outside_literals(self):
+        for _ in range(self.case_count // 10):
+            profile = better_space.OperationProfile("detab-code", self.random.randint(1, 8))
+            line_ranges = self.__generate_line_ranges()
+            for file_name, literals in self.LITERALS_BY_FILE_NAME.items():
+                pieces = []
+                for _ in range(self.random.randint(0, 12)):
+                    pieces.append("".join(self.random.choices([SPACE, TAB, TAB, "\n", "a", "1", ";", "="],
+                                                              k=self.random.randint(0, 6))))
+                    if self.random.random() < 0.5:
+                        pieces.append(f"({self.random.choice(literals)})")
+                text = "".join(pieces)
+
+                result = self.__conform_code(file_name, text, profile, line_ranges)
+
+                self.assertFalse(r"\t" in result, f"conform_lines({text!r}) of {file_name} with tab_size={profile.tab_size}, "
+                                 f"line_ranges={line_ranges}: {result!r}; seed {self.seed}")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file